@@ -1,3 +1,12 @@
 from agilent_54622d import Scope
 from agilent_33120a import FunctionGenerator
 from agilent_e3634a import PowerSupply
+from pool import InstrumentPool
+from capture import Capture, CaptureArchive, CaptureHistory
+from search import TransactionIndex
+from common import OperationTimeout, OperationCancelled
+from stats import InstrumentStats
+from screenshots import ScreenshotArchive, ScreenshotRecorder
+from setups import Setup, SetupLibrary
+from sweep import Sweep
+from agilent_e3634a import SupplyLogger
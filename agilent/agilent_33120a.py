@@ -1,4 +1,9 @@
-from common import Instrument, format_number as fmt
+from common import Instrument, format_number as fmt, QUERY_NONE
+from collections import OrderedDict
+import hashlib
+import re
+
+DAC_MAX = 2047 # Arbitrary waveform DAC codes run from -2047 to +2047
 
 def normalize(l, minimum=-1.0, maximum=1.0):
     M,m = float(max(l)),float(min(l))
@@ -6,6 +11,17 @@ def normalize(l, minimum=-1.0, maximum=1.0):
     target_range = float(maximum-minimum)
     return [((x-m)/input_range)*target_range + minimum for x in l]
 
+def quantize(waveform):
+    '''
+    Scale a waveform to the full range of DAC codes.  Returns a numpy array of 16-bit integers.  Requires numpy.
+    '''
+    import numpy
+    waveform = numpy.asarray(waveform, dtype=float)
+    M, m = waveform.max(), waveform.min()
+    if M == m:
+        return numpy.zeros(len(waveform), dtype=numpy.int16)
+    return numpy.round((waveform - m)*(2.0*DAC_MAX/(M - m)) - DAC_MAX).astype(numpy.int16)
+
 class FunctionGenerator(Instrument): 
 
     SIN = 'SIN'
@@ -20,13 +36,19 @@ class FunctionGenerator(Instrument):
     LOAD_INFINITY = 'INF'
     LOADS = (LOAD_50OHMS, LOAD_INFINITY)
 
-    def __init__(self,port="COM1",baud=57600, timeout=5, verbose=False):
-        Instrument.__init__(self, port, baud, timeout, verbose)
+    MIRRORED_QUERIES = ("FREQ", "VOLT", "OFFS", "OUTP:LOAD")
+    MIRROR_INVALIDATORS = Instrument.MIRROR_INVALIDATORS + ("APPL",)
+    # Amplitude and offset are reported into the selected load, and are clamped to the limits of the new shape
+    MIRROR_DEPENDENCIES = {"OUTP:LOAD" : ("VOLT", "OFFS"), "FUNC:SHAP" : ("FREQ", "VOLT", "OFFS")}
+
+    def __init__(self,port="COM1",baud=57600, timeout=5, verbose=False, connect=True, offline=False):
+        Instrument.__init__(self, port, baud, timeout, verbose, connect=connect, offline=offline)
+        self.waveforms = WaveformLibrary(self)
 
-    def apply(self, type, freq=None, amp=None, offset=None):
+    def apply(self, type, freq=None, amp=None, offset=None, check=True):
         if type not in FunctionGenerator.TYPES:
-            raise ValueError("Type must be one of %s" % (TYPES,))
-        self.command("APPL:%s %s,%s,%s" % (type, fmt(freq), fmt(amp), fmt(offset)))
+            raise ValueError("Type must be one of %s" % (FunctionGenerator.TYPES,))
+        self.commands((("APPL:%s %s,%s,%s" % (type, fmt(freq), fmt(amp), fmt(offset)), QUERY_NONE),), check=check)
 
     def __set_amplitude(self, voltage):
         self.command("VOLT %s" % fmt(voltage))
@@ -56,13 +78,29 @@ class FunctionGenerator(Instrument):
     load = property(__get_load, __set_load)
 
 
-    def upload_waveform(self, waveform):
+    def upload_waveform(self, waveform, binary=False):
+        '''
+        Upload a waveform to volatile memory, scaled to the full range of the DAC.
+
+        The DAC codes are sent as comma separated integers.  If binary is set, they are sent as a
+        binary block of 16-bit codes instead, which is much shorter but needs a link (eg: GPIB)
+        that passes binary blocks: the 33120A doesn't accept them over RS-232.  Requires numpy.
+        '''
         if len(waveform) < 8 or len(waveform) > 16000:
             raise ValueError("Waveform must be between 8 and 16000 points")
-        waveform = map(str, map(fmt, normalize(waveform)))
-        cmd = "DATA VOLATILE,%s" % ",".join(waveform)
-        print cmd
-        self.command(cmd)
+        self.upload_codes(quantize(waveform), binary=binary)
+
+    def upload_codes(self, codes, binary=False):
+        '''
+        Upload a waveform that has already been quantized to DAC codes.  See upload_waveform()
+        '''
+        self.waveforms.volatile = None
+        if binary:
+            data = codes.astype('>i2').tostring()
+            self.commands([ ("FORM:BORD NORM", QUERY_NONE),
+                            ("DATA:DAC VOLATILE, #%d%d%s" % (len(str(len(data))), len(data), data), QUERY_NONE)])
+        else:
+            self.command("DATA:DAC VOLATILE, %s" % ",".join(map(str, codes)))
 
 
     def download_waveform(self):
@@ -71,3 +109,99 @@ class FunctionGenerator(Instrument):
     def use_arbitrary_waveform(self, name='VOLATILE'):
         self.command("FUNC:USER %s" % name)
 
+
+class WaveformLibrary(object):
+    '''
+    Keeps track of which arbitrary waveforms are already stored in the generator, so that they
+    are only uploaded once.
+
+    Waveforms are identified by a hash of their DAC codes, and stored in the non-volatile slots
+    under a name derived from it.  When all of the slots are in use, the least recently used
+    waveform is deleted to make room.
+    '''
+    PREFIX = "W"
+
+    def __init__(self, generator, slots=4):
+        self.generator = generator
+        self.slots = slots
+        self.volatile = None # Hash of the waveform in VOLATILE memory, if known
+        self.resident = None # Our waveforms in non-volatile memory, least recently used first
+        self.others = 0 # Slots used by waveforms stored by someone else
+        self.active = None
+
+    def __str__(self):
+        return "<WaveformLibrary: %s>" % ", ".join(self.resident or [])
+
+    def __repr__(self):
+        return str(self)
+
+    @staticmethod
+    def hash(codes):
+        return hashlib.sha1(codes.astype('>i2').tostring()).hexdigest()
+
+    @classmethod
+    def name(cls, hash):
+        return (cls.PREFIX + hash[:7]).upper()
+
+    @classmethod
+    def ours(cls, name):
+        '''
+        Whether name is one that name() generates, rather than a waveform stored by someone else
+        '''
+        return re.match("^%s[0-9A-F]{7}$" % re.escape(cls.PREFIX), name) != None
+
+    def refresh(self):
+        '''
+        Read the names of the waveforms stored in non-volatile memory from the generator.
+        '''
+        names = [name.strip().strip('"') for name in self.generator.query("DATA:NVOL:CAT?").split(',')]
+        self.resident = OrderedDict((name, True) for name in names if self.ours(name))
+        # Someone else's waveforms take up slots too
+        self.others = len([name for name in names if name and not self.ours(name)])
+
+    def __contains__(self, waveform):
+        if self.resident == None:
+            self.refresh()
+        return self.name(self.hash(quantize(waveform))) in self.resident
+
+    def use(self, waveform, store=True, binary=False):
+        '''
+        Select waveform as the arbitrary waveform, uploading it only if it isn't already in the generator.
+
+        If store is set, the waveform is copied into a named non-volatile slot so that it can be
+        selected again later without uploading it.  Returns the name the waveform was selected by.
+        '''
+        if self.resident == None:
+            self.refresh()
+        codes = quantize(waveform)
+        hash = self.hash(codes)
+        name = self.name(hash)
+        if name in self.resident:
+            del self.resident[name]
+            self.resident[name] = True
+        else:
+            if self.volatile != hash:
+                self.generator.upload_codes(codes, binary=binary)
+                self.volatile = hash
+            if not store:
+                name = "VOLATILE"
+            else:
+                self.evict(self.slots - 1)
+                self.generator.command("DATA:COPY %s,VOLATILE" % name)
+                self.resident[name] = True
+        self.generator.use_arbitrary_waveform(name)
+        self.active = name
+        return name
+
+    def evict(self, slots):
+        '''
+        Delete least recently used waveforms until no more than slots are in use.  The active waveform is never deleted.
+        '''
+        if self.resident == None:
+            self.refresh()
+        for name in list(self.resident):
+            if len(self.resident) + self.others <= slots:
+                break
+            if name != self.active:
+                self.generator.command("DATA:DEL %s" % name)
+                del self.resident[name]
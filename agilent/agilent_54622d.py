@@ -1,8 +1,11 @@
 from __future__ import with_statement
-from common import Instrument, PNGImage, QUERY_ASCII, QUERY_BINARY, QUERY_NONE
+from common import Instrument, ArraySink, exclusive, TIFFImage, read_block, tiff_to_png, QUERY_ASCII, QUERY_BINARY, QUERY_NONE, OperationTimeout, OperationCancelled
 from processing import *
-from StringIO import StringIO
+from capture import Capture, CaptureHistory
+from setups import SetupLibrary
+from stats import metered
 import time
+import warnings
 
 ANALOG_1 = "CHAN1"
 ANALOG_2 = "CHAN2"
@@ -66,8 +69,34 @@ PHASE = "PHAS"
 PRESHOOT = "PRES"
 PULSE_WIDTH = "PWID"
 
+# Measurement name -> :MEAS mnemonic
+MEASUREMENTS = {'max' : 'VMAX', 'min' : 'VMIN', 'avg' : 'VAV', 'amplitude' : 'VAMP', 'top' : 'VTOP', 'base' : 'VBAS',
+                'frequency' : 'FREQ', 'period' : PERIOD, 'duty_cycle' : 'DUTY', 'pwidth' : 'PWIDTH', 'nwidth' : 'NWIDTH',
+                'rise_time' : 'RIS', 'fall_time' : 'FALL', 'overshoot' : 'OVER', 'undershoot' : PRESHOOT, 'phase' : PHASE}
+
+INVALID_MEASUREMENT = 9.9E+37 # Returned by the scope when a measurement can't be made
+
+RUN_BIT = 8 # Operation status condition register: set while the scope is acquiring
+
 def format_nr3(number):
     return '{:+E}'.format(float(number))
+
+def parse_preamble(preamble):
+    '''
+    Parse the response to :WAV:PRE? into a dictionary
+    '''
+    fields = preamble.split(',')
+    retval = dict(zip(('format', 'type', 'points', 'count'), map(int, map(float, fields[0:4]))))
+    retval.update(zip(('xincrement', 'xorigin', 'xreference', 'yincrement', 'yorigin', 'yreference'), map(float, fields[4:10])))
+    return retval
+
+def scale_samples(data, preamble):
+    '''
+    Convert a block of BYTE format waveform data to a list of values, using a parsed preamble
+    '''
+    yinc, yorigin, yreference = preamble['yincrement'], preamble['yorigin'], preamble['yreference']
+    return [(ord(x)-yreference)*yinc + yorigin for x in data]
+
 class Channel(object):
     
     def __init__(self, parent, name):
@@ -97,10 +126,10 @@ class Channel(object):
     def __set_label(self, label):
         label = Channel.format_label(label)
         self.scope.command(':%s:LAB "%s"' % (self.name, label))
-        self.scope.label_cache[self] = label
+        self.scope._cache_label(self, label)
     def __get_label(self):
         label = self.scope.query(":%s:LAB?" % self.name)[1:-1]
-        self.scope.label_cache[self] = label
+        self.scope._cache_label(self, label)
         return label
     label = property(__get_label, __set_label)
 
@@ -142,6 +171,27 @@ class Channel(object):
             except:
                 return False
 
+class Measurements(dict):
+    '''
+    Results of a batch of measurements, by measurement name.  Also accessible as attributes.
+
+    Measurements the scope could not make are None.
+    '''
+    def __getattr__(self, item):
+        try:
+            return self[item]
+        except KeyError:
+            raise AttributeError(item)
+
+    @staticmethod
+    def name(item):
+        if item.lower() in MEASUREMENTS:
+            return item.lower()
+        for name, mnemonic in MEASUREMENTS.items():
+            if item.upper() == mnemonic:
+                return name
+        raise ValueError("%s is not a valid measurement.  Must be one of %s" % (item, sorted(MEASUREMENTS)))
+
 class DigitalChannel(Channel):
 
     def __init__(self, parent, name):
@@ -236,24 +286,29 @@ class Pod(object):
         t = list(dataStr)
         for i in range(len(t)):
             t[i] = xorigin+xinc*(i-xreference)
-        
+
         if dataStr:
-            retval = {}
             try:
-                result = map(ord,dataStr)
+                return t,self.unpack(dataStr)
             except:
                 self.scope.errors()
                 raise
-
-            for i,key in enumerate([channel.name for channel in self.channels]):
-                retval[key] = []
-                for j in result:
-                    retval[key].append(1 if bool(j & (1 << i)) else 0)
-            return t,retval
         else:
             raise Exception("No data returned.  Waveform buffer is empty.")
             self.errors()
 
+    def unpack(self, dataStr):
+        '''
+        Split a block of pod data (one byte per sample) into a list of 1s and 0s for each channel
+        '''
+        retval = {}
+        result = map(ord,dataStr)
+        for i,key in enumerate([channel.name for channel in self.channels]):
+            retval[key] = []
+            for j in result:
+                retval[key].append(1 if bool(j & (1 << i)) else 0)
+        return retval
+
     def get_data(self, points=1000):
         t,data = self.get_rawdata(points=points)
         return t, data
@@ -275,7 +330,7 @@ class AnalogChannel(Channel):
     def __get_scale(self):
         return float(self.scope.query(":%s:SCAL?" % self.name))
     def __set_scale(self, scale):
-        self.scope.query(":%s:SCAL %s V" % (self.name, format_nr3(scale)))
+        self.scope.command(":%s:SCAL %s V" % (self.name, format_nr3(scale)))
     scale = property(__get_scale, __set_scale)
 
     # Vertical offset (in volts)
@@ -355,6 +410,13 @@ class AnalogChannel(Channel):
     def phase(self):
         return float(self.scope.query(":MEAS:PHAS? %s" % self.name))
 
+    def measure(self, items=None):
+        '''
+        Make several measurements in one batch.  items are measurement names (eg: 'frequency') or
+        :MEAS mnemonics (eg: 'FREQ'), and default to all of them.  Returns a Measurements record.
+        '''
+        return self.scope.measure_all(items, channels=(self,))[self.name]
+
     def get_rawdata(self, points=1000):
         if points not in (100, 200, 500, 1000, 2000, None):
             raise ValueError("Number of points for acquisition should be 100, 200, 500, 1000 or 2000")
@@ -460,13 +522,38 @@ class EdgeTrigger(StandardTrigger):
         self.scope.command(":TRIG:EDGE:LEV %s" % format_nr3(level))
     level = property(__get_level, __set_level)
 
-class BiDict(dict):
-    def __init__(self, *args):
-        dict.__init__(self, args)
+class LazyDict(dict):
+    '''
+    Dictionary of key -> factory, where each value is only created the first time it's looked up
+    '''
+    def __init__(self, factories):
+        dict.__init__(self)
+        self.factories = factories
+
+    def __missing__(self, key):
+        value = self[key] = self.factories[key]()
+        return value
+
+    def __contains__(self, key):
+        return key in self.factories
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self):
+        return len(self.factories)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return self.factories.keys()
 
-    def __setitem__(self, key, val):
-        dict.__setitem__(self, key, val)
-        dict.__setitem__(self, val, key)
+    def values(self):
+        return [self[key] for key in self.factories]
+
+    def items(self):
+        return [(key, self[key]) for key in self.factories]
 
 class Scope(Instrument):
     """
@@ -475,7 +562,19 @@ class Scope(Instrument):
     BMP = 0
     PNG = 1
 
-    def __init__(self,port="COM1",baud=57600, timeout=5, verbose=False, rtscts=True):
+    MIRRORED_QUERIES = tuple([":TIM:SCAL", ":TIM:POS", ":TRIG:MODE", ":TRIG:SOUR", ":TRIG:SLOP", ":TRIG:EDGE:LEV", ":TRIG:SWEEP"] +
+                             [":%s:%s" % (channel, setting) for channel in ANALOG for setting in ("DISP", "SCAL", "OFFS", "COUP", "LAB")] +
+                             [":%s:%s" % (channel, setting) for channel in DIGITAL for setting in ("DISP", "POS", "LAB")] +
+                             [":MARK:%sP" % cursor for cursor in CURSORS])
+    MIRROR_INVALIDATORS = Instrument.MIRROR_INVALIDATORS + (":AUT", ":SYST:SET")
+    FRONT_PANEL_EVENTS = True
+
+    # Shortcut attributes, created on first use: attribute -> channel, pod or cursor name
+    SHORTCUTS = dict([('a1', ANALOG_1), ('a2', ANALOG_2), ('math', MATH), ('pod1', POD1), ('pod2', POD2),
+                      ('x1', X1), ('x2', X2), ('y1', Y1), ('y2', Y2)] +
+                     [('d%d' % i, channel) for i, channel in enumerate(DIGITAL)])
+
+    def __init__(self,port="COM1",baud=57600, timeout=5, verbose=False, rtscts=True, label_ttl=None, connect=True, offline=False):
         """
         Creates a connection to the serial port with the specified settings.
         
@@ -483,61 +582,31 @@ class Scope(Instrument):
         baudRate -> Baud rate. Possible values: 9600, 19200, 38400, or 57600
         timeout -> Maximum time in seconds to wait for scope to respond.
                    Possible values: an int >= 0
+        label_ttl -> Maximum age in seconds of the channel label index before it is re-read
+                     from the scope.  None to trust it until it is invalidated.
+        connect -> If False, the serial port isn't opened until it is first used.
+        offline -> If True, the serial port is never opened.  See Instrument.
         """
-        Instrument.__init__(self, port=port, baud=baud, timeout=timeout, verbose=verbose, rtscts=rtscts)
-        self.channels = {} 
-        self.cursors = {}
-        self.pods = {}
-
+        # Label index: label -> channel, and channel name -> label
         self.label_cache = {}
+        self.channel_labels = {}
+        self.label_cache_time = None
+        self.label_ttl = label_ttl
 
-        # Channels
-        self.channels[ANALOG_1] = AnalogChannel(self, ANALOG_1)
-        self.channels[ANALOG_2] = AnalogChannel(self, ANALOG_2)
-        self.channels[MATH] = MathChannel(self, MATH)
+        # Channels, pods and cursors are created the first time they're used.  These have to be
+        # set before anything else, as __getattr__ falls back on looking attributes up by label.
+        self.channels = LazyDict({ANALOG_1 : lambda: AnalogChannel(self, ANALOG_1),
+                                  ANALOG_2 : lambda: AnalogChannel(self, ANALOG_2),
+                                  MATH : lambda: MathChannel(self, MATH)})
+        self.pods = LazyDict(dict((pod, lambda pod=pod: Pod(self, pod)) for pod in PODS))
+        self.cursors = LazyDict(dict((cursor, lambda cursor=cursor: Cursor(self, cursor)) for cursor in CURSORS))
+
+        Instrument.__init__(self, port=port, baud=baud, timeout=timeout, verbose=verbose, rtscts=rtscts, connect=connect, offline=offline)
 
-        
-        self.pods[POD1] = Pod(self,POD1)
-        self.pods[POD2] = Pod(self,POD2)
-
-        # Cursors
-        self.cursors[X1] = Cursor(self, X1)
-        self.cursors[X2] = Cursor(self, X2)
-        self.cursors[Y1] = Cursor(self, Y1)
-        self.cursors[Y2] = Cursor(self, Y2)
-
-        self.x1 = self.cursors[X1]
-        self.x2 = self.cursors[X2]
-        self.y1 = self.cursors[Y1]
-        self.y2 = self.cursors[Y2]
-
-        self.pod1 = self.pods[POD1]
-        self.pod2 = self.pods[POD2]
-
-        self.a1 = self[ANALOG_1]
-        self.a2 = self[ANALOG_2]
-        self.math = self[MATH]
-
-        self.d0 = self[DIGITAL_0]
-        self.d1 = self[DIGITAL_1]
-        self.d2 = self[DIGITAL_2]
-        self.d3 = self[DIGITAL_3]
-        self.d4 = self[DIGITAL_4]
-        self.d5 = self[DIGITAL_5]
-        self.d6 = self[DIGITAL_6]
-        self.d7 = self[DIGITAL_7]
-        self.d8 = self[DIGITAL_8]
-        self.d9 = self[DIGITAL_9]
-        self.d10 = self[DIGITAL_10]
-        self.d11 = self[DIGITAL_11]
-        self.d12 = self[DIGITAL_12]
-        self.d13 = self[DIGITAL_13]
-        self.d14 = self[DIGITAL_14]
-        self.d15 = self[DIGITAL_15]
-        
         self.saved_setup = None
-    
-        self.label_cache = BiDict()
+        self.setups = SetupLibrary(self)
+        self.last_labels = None
+        self.history = None
 
     def __str__(self):
         return "<Agilent 54622D on %s @ %d Baud>" % (self.comPortName, self.baudRate)
@@ -561,26 +630,36 @@ class Scope(Instrument):
         return float(self.query(":TIM:POS?"))
     position = property(__get_pos, __set_pos)
 
-    def clear_labels(self):
-        for channel in self:
-            channel.label = ""
-            self.label_cache[channel] = ""
-    
     def set_labels(self, labels):
-        for channel, label in labels.items():
-            self.set_label(channel, label)
+        '''
+        Set the labels of several channels at once, from a dictionary of channel -> label
+        '''
+        channels = [(self[channel], Channel.format_label(label)) for channel, label in labels.items()]
+        self.commands([(':%s:LAB "%s"' % (channel.name, label), QUERY_NONE) for channel, label in channels])
+        for channel, label in channels:
+            self._cache_label(channel, label)
 
     def __getattr__(self, item):
+        if item.startswith('_'):
+            raise AttributeError(item)
+        if item in Scope.SHORTCUTS:
+            value = self[Scope.SHORTCUTS[item]]
+            self.__dict__[item] = value
+            return value
         try:
             return self.get_channel_from_label(item)
         except:
             raise AttributeError
     def __getitem__(self, key):
-        for x in (self.channels, self.cursors) + tuple(self.pods.values()) + (self.pods,):
+        if isinstance(key, Channel):
+            return key
+        for x in (self.channels, self.cursors, self.pods):
             try:
                 return x[key]
             except:
                 continue
+        if key in DIGITAL:
+            return self.pods[POD1 if DIGITAL.index(key) < 8 else POD2][key]
         
         if key in self:
             return key
@@ -589,11 +668,13 @@ class Scope(Instrument):
         return self.get_channel_from_label(key)
 
 
-    def single(self):
+    def single(self, wait=False, timeout=None):
         '''
-        Aquire a single trigger of data.
+        Aquire a single trigger of data.  If wait is set, block until the acquisition is complete.
         '''
         self.command(":SING")
+        if wait:
+            self.wait_for_acquisition(timeout=timeout)
 
     def run(self):
         '''
@@ -601,8 +682,37 @@ class Scope(Instrument):
         '''
         self.command(":RUN")
 
-    def digitize(self):
+    def digitize(self, wait=False, timeout=None):
+        '''
+        Acquire data using the current acquisition setup.  If wait is set, block until the acquisition is complete.
+        '''
         self.command(":DIG")
+        if wait:
+            self.wait_for_acquisition(timeout=timeout, opc=True)
+
+    def acquiring(self):
+        '''
+        Returns True if the scope is still running an acquisition.
+        '''
+        return bool(int(float(self.commands([(":OPER:COND?", QUERY_ASCII)], check=False)[0])) & RUN_BIT)
+
+    def wait_for_acquisition(self, timeout=None, interval=0.05, cancel=None, opc=False):
+        '''
+        Wait for the current acquisition to complete.
+
+        By default the run bit of the operation status register is polled every interval seconds.
+        If opc is set, *OPC? is used instead, which is appropriate after :DIG.  Raises
+        OperationTimeout after timeout seconds, or OperationCancelled if the cancel event is set.
+        '''
+        if opc:
+            return self.operation_complete(timeout=timeout, interval=interval, cancel=cancel)
+        start = time.time()
+        while self.acquiring():
+            if cancel != None and cancel.is_set():
+                raise OperationCancelled("Cancelled while waiting for acquisition to complete.")
+            if timeout != None and time.time() - start > timeout:
+                raise OperationTimeout("Timed out waiting for acquisition to complete.")
+            time.sleep(interval)
 
     def __set_lock(self, lock):
         self.command(":SYST:LOCK %d" % (1 if lock else 0))
@@ -612,74 +722,69 @@ class Scope(Instrument):
     def unlock(self):
         self.__set_lock(False)
 
-    def __screenshot(self):
+    @exclusive
+    @metered("screenshot")
+    def __screenshot(self, fp=None, chunk_size=4096, callback=None):
         self.errors()
         self.port.open()
         try:
             cmd = ":DISP:DATA? TIFF,SCR"
             #print "--> '%s'" % cmd 
             self.port.write(cmd + '\n')
+            retval = read_block(self.port, fp=fp, chunk_size=chunk_size, callback=callback)
+        except:
+            self.port.close()
+            raise
+        self.port.close()
+        return retval
 
-            resp = self.port.read(2)
-            pound, digits = resp
-            #print "<-- '%s'" % resp
-            if pound != "#": raise Exception("Unexpected response in screenshot acquisition.")
-            try: digits =int(digits)
-            except: raise Exception("Could not read screenshot block size.")
-            try: size = int(self.port.read(digits))
-            except: raise Exception("Could not read screenshot block size.")
-            retval = ''
-            # Hack so we get ALL the data from the slow-ass scope.
-            while len(retval) < size:
-                retval += self.port.read()
-            #print "<-- <%d bytes of binary data>" % len(retval)
-            
+    @exclusive
+    @metered("read_data")
+    def __read_data(self, fp, chunk_size=4096, callback=None):
+        # Read the current waveform source's data block into fp, a chunk at a time
+        self.errors()
+        self.port.open()
+        try:
+            self.port.write(":WAV:DATA?\n")
+            retval = read_block(self.port, fp=fp, chunk_size=chunk_size, callback=callback)
         except:
             self.port.close()
             raise
         self.port.close()
         return retval
 
-    def take_screenshot(self, filename=None):
+    def save_screenshot(self, fp, chunk_size=4096, callback=None):
         '''
-        Take screenshot.  Save as png if filename provided.
+        Stream a screenshot to fp (a filename or file-like object) in TIFF format, without decoding it.
+
+        callback, if provided, is called as callback(bytes_read, size) as the data comes in.
+        Returns the size of the image data.
         '''
-        import ImageFile
-        
-        # Actually collect data from the scope, once we've determined that PIL is present
-        screen_data = self.__screenshot()
+        if isinstance(fp, basestring):
+            with open(fp, 'wb') as f:
+                return self.__screenshot(fp=f, chunk_size=chunk_size, callback=callback)
+        return self.__screenshot(fp=fp, chunk_size=chunk_size, callback=callback)
 
-        # Create an image in memory so we can manipulate/reformat it
-        p = ImageFile.Parser()
-        p.feed(screen_data)
-        im = p.close()
-        
-        # This will save the image in whatever format pil picks for the file extension
-        if filename:
-            im.save(filename)
+    def take_screenshot(self, filename=None):
+        '''
+        Take screenshot.  Save it if filename provided, in whatever format is picked for the file extension.
 
-        buffer = StringIO()
-        im.save(buffer, 'PNG')
-        png_screen_data = buffer.getvalue()
-        buffer.close()
-        return PNGImage(png_screen_data)
+        The returned image is only converted to PNG when it's displayed (or its image_data is asked for).
+        '''
+        image = TIFFImage(self.__screenshot())
+        if filename:
+            image.save(filename)
+        return image
 
     def get_screenshot(self, format=0):
         screen_data = self.__screenshot()
         if format == Scope.BMP:
             return screen_data
         elif format == Scope.PNG:
-            import ImageFile, StringIO
-            p = ImageFile.Parser()
-            p.feed(screen_data)
-            im = p.close()
-            fp = StringIO.StringIO()
-            im.save(fp, "PNG")
-            value = fp.getvalue()
-            fp.close()
-            return value
+            return tiff_to_png(screen_data)
         else:
             raise ValueError("Invalid image type.")
+
     def acquire(self, waveforms, points=1000):
         # TODO, UPDATE THIS TO INCLUDE ANALOG STUFF
         t = []
@@ -705,13 +810,139 @@ class Scope(Instrument):
             else:
                 t, d = self[waveform].get_data(points=points)
                 retval[waveform] = d
+        if self.history != None:
+            self.__record(Capture(t, retval))
         return t, retval
 
+    def stream(self, waveforms, points=1000, max_rate=None, count=None, timeout=None):
+        '''
+        Acquire repeatedly, yielding a Capture for each trigger.
+
+        The acquisition setup is only sent once.  The scope is re-armed as soon as the data for a
+        frame has been read, so the next acquisition runs while the previous one is being decoded.
+        max_rate limits the number of frames per second, count limits the total number of frames.
+        '''
+        if points not in (100, 200, 500, 1000, 2000, None):
+            raise ValueError("Number of points for acquisition should be 100, 200, 500, 1000 or 2000")
+        if points == None:
+            points = "MAX"
+
+        # Work out which waveform sources we have to read to get all of the requested waveforms
+        sources = []
+        names = {}
+        for waveform in waveforms:
+            channel = self[waveform]
+            names[waveform] = channel.name
+            source = channel.pod.name if isinstance(channel, DigitalChannel) else channel.name
+            if source not in sources:
+                sources.append(source)
+
+        self.commands([ (":STOP", QUERY_NONE),
+                        (":TIM:MODE NORM", QUERY_NONE),
+                        (":ACQ:TYPE NORM", QUERY_NONE),
+                        (":WAV:FORM BYTE", QUERY_NONE),
+                        (":WAV:POIN %s" % str(points), QUERY_NONE),
+                        (":SING", QUERY_NONE)])
+        armed = time.time()
+        preambles = {}
+        frames = 0
+        while count == None or frames < count:
+            self.wait_for_acquisition(timeout=timeout)
+            timestamp = time.time()
+            frames += 1
+
+            batch = []
+            for source in sources:
+                batch.append((":WAV:SOUR %s" % source, QUERY_NONE))
+                if source not in preambles:
+                    batch.append((":WAV:PRE?", QUERY_ASCII))
+                batch.append((":WAV:DATA?", QUERY_BINARY))
+
+            # Re-arm in the same batch as the readout, unless we have to hold off to respect max_rate
+            rearm = count == None or frames < count
+            if rearm and (max_rate == None or time.time() - armed >= 1.0/max_rate):
+                batch.append((":SING", QUERY_NONE))
+                armed = time.time()
+                rearm = False
+            response = iter(self.commands(batch))
+
+            blocks = {}
+            for source in sources:
+                response.next()
+                if source not in preambles:
+                    preambles[source] = parse_preamble(response.next())
+                blocks[source] = response.next()
+
+            if rearm:
+                time.sleep(max(0, armed + 1.0/max_rate - time.time()))
+                self.command(":SING")
+                armed = time.time()
+
+            # Decode while the next acquisition is running
+            preamble = preambles[sources[0]]
+            xinc, xorigin, xreference = preamble['xincrement'], preamble['xorigin'], preamble['xreference']
+            t = [xorigin+xinc*(i-xreference) for i in range(len(blocks[sources[0]]))]
+            data = {}
+            for source in sources:
+                if source in self.pods:
+                    data.update(self.pods[source].unpack(blocks[source]))
+                else:
+                    data[source] = scale_samples(blocks[source], preambles[source])
+            capture = Capture(t, dict((waveform, data[names[waveform]]) for waveform in waveforms), timestamp)
+            if self.history != None:
+                self.__record(capture)
+            yield capture
+
+    def __record(self, capture):
+        # History bookkeeping must never cost the caller the data that was just acquired
+        try:
+            self.history.append(capture)
+        except Exception, e:
+            warnings.warn("Capture not added to history: %s" % e)
+
+    def enable_history(self, frames=None, max_bytes=None):
+        '''
+        Keep the last frames captures (or as many as fit in max_bytes) from acquire() and stream()
+        in a CaptureHistory, self.history.  Requires numpy.
+        '''
+        self.history = CaptureHistory(frames, max_bytes)
+        return self.history
+
+    def disable_history(self):
+        self.history = None
+
+    def measure_all(self, items=None, channels=ANALOG):
+        '''
+        Make several measurements on several channels in one batch.
+
+        Returns a dictionary of channel name -> Measurements.  See AnalogChannel.measure()
+        '''
+        names = map(Measurements.name, items or sorted(MEASUREMENTS))
+        channels = [self[channel] for channel in channels]
+        queries = [(":MEAS:%s? %s" % (MEASUREMENTS[name], channel.name), QUERY_ASCII) for channel in channels for name in names]
+        results = iter(self.commands(queries))
+        retval = {}
+        for channel in channels:
+            measurements = Measurements()
+            for name in names:
+                value = float(results.next())
+                measurements[name] = None if value >= INVALID_MEASUREMENT else value
+            retval[channel.name] = measurements
+        return retval
+
     def get_labels(self, *channels):
+        '''
+        Read the labels of the provided channels (or all channels) from the scope, in one batch.
+        '''
         channels = channels or ANALOG + DIGITAL
+        objects = [self[channel] for channel in channels]
+        labels = self.commands([(":%s:LAB?" % channel.name, QUERY_ASCII) for channel in objects])
         retval = {}
-        for channel in channels:
-            retval[channel] = self[channel].save_label()
+        for name, channel, label in zip(channels, objects, labels):
+            label = label[1:-1]
+            self._cache_label(channel, label)
+            channel.last_label = label
+            retval[name] = label
         return retval
 
     def save_labels(self, *channels):
@@ -720,21 +951,42 @@ class Scope(Instrument):
 
     def clear_labels(self, *channels):
         channels = channels or ANALOG + DIGITAL
-        for channel in channels:
-            self[channel].label = ""
+        self.set_labels(dict((channel, "") for channel in channels))
+
+    def refresh_labels(self):
+        '''
+        Re-read the labels of all channels from the scope, in one batch, and rebuild the label index.
+        '''
+        channels = list(self)
+        labels = self.commands([(":%s:LAB?" % channel.name, QUERY_ASCII) for channel in channels])
+        self.label_cache = {}
+        self.channel_labels = {}
+        for channel, label in zip(channels, labels):
+            self._cache_label(channel, label[1:-1])
+        self.label_cache_time = time.time()
+
+    def invalidate_labels(self):
+        '''
+        Forget the label index, so that it is re-read on the next lookup by label.
+        '''
+        self.label_cache_time = None
+
+    def _cache_label(self, channel, label):
+        old = self.channel_labels.get(channel.name)
+        if old and self.label_cache.get(old) is channel:
+            del self.label_cache[old]
+        self.channel_labels[channel.name] = label
+        if label:
+            self.label_cache[label] = channel
 
     def get_channel_from_label(self, label):
         label = Channel.format_label(label)
-        if label in self.label_cache:
-            channel = self.label_cache[label]
-            if channel.label == label:
-                return channel
-
-        # Fallback: scan ALL the channels
-        for channel in self:
-            if channel.label == label:
-                return channel
-        raise KeyError("No channel with label %s" % label)
+        if self.label_cache_time == None or (self.label_ttl != None and time.time() - self.label_cache_time > self.label_ttl):
+            self.refresh_labels()
+        try:
+            return self.label_cache[label]
+        except KeyError:
+            raise KeyError("No channel with label %s" % label)
 
     def restore_labels(self, labels=None):
         if labels == None:
@@ -774,6 +1026,133 @@ class Scope(Instrument):
         analyzer = SPIAnalyzer(t, channels[miso], channels[mosi], channels[sck], channels[cs])
         return analyzer.transactions()
 
+    def read_pods(self, points=1000):
+        '''
+        Read the raw data from both pods, one byte per sample, in one batch.  Returns the timebase
+        (as a numpy array) and the POD1 and POD2 data.  Requires numpy.
+        '''
+        import numpy
+        if points not in (100, 200, 500, 1000, 2000, None):
+            raise ValueError("Number of points for acquisition should be 100, 200, 500, 1000 or 2000")
+        if points == None:
+            points = "MAX"
+        response = self.commands([  (":TIM:MODE NORM", QUERY_NONE),
+                                    (":ACQ:TYPE NORM", QUERY_NONE),
+                                    (":WAV:FORM BYTE", QUERY_NONE),
+                                    (":WAV:POIN %s" % str(points), QUERY_NONE),
+                                    (":WAV:SOUR %s" % POD1, QUERY_NONE),
+                                    (":WAV:PRE?", QUERY_ASCII),
+                                    (":WAV:DATA?", QUERY_BINARY),
+                                    (":WAV:SOUR %s" % POD2, QUERY_NONE),
+                                    (":WAV:DATA?", QUERY_BINARY)])
+        preamble, pod1, pod2 = parse_preamble(response[5]), response[6], response[8]
+        if not pod1 or not pod2:
+            raise Exception("No data returned.  Waveform buffer is empty.")
+        t = preamble['xorigin'] + preamble['xincrement']*(numpy.arange(len(pod1)) - preamble['xreference'])
+        return t, pod1, pod2
+
+    def acquire_deep(self, waveforms, archive=None, chunk_size=4096, callback=None, cancel=None):
+        '''
+        Read the whole acquisition memory (:WAV:POIN MAX) for waveforms.  Returns a Capture of
+        numpy arrays, which is also saved to archive (a CaptureArchive) if provided.
+
+        Each source's data is read a chunk at a time straight into a preallocated byte array,
+        then scaled (analog channels) or split into bits (pods).  callback, if provided, is called
+        as callback(bytes_read, total) after every chunk, and the read stops with
+        OperationCancelled if the cancel event gets set.  Stop the scope first (eg: with
+        single(wait=True)) to get the full record.  Requires numpy.
+        '''
+        import numpy
+        waveforms = list(waveforms)
+        sources = []
+        names = {}
+        for waveform in waveforms:
+            channel = self[waveform]
+            names[waveform] = channel.name
+            source = channel.pod.name if isinstance(channel, DigitalChannel) else channel.name
+            if source not in sources:
+                sources.append(source)
+
+        # The preambles give the size of every block, so the buffers can be allocated up front
+        batch = [(":TIM:MODE NORM", QUERY_NONE),
+                 (":ACQ:TYPE NORM", QUERY_NONE),
+                 (":WAV:FORM BYTE", QUERY_NONE),
+                 (":WAV:POIN MAX", QUERY_NONE)]
+        for source in sources:
+            batch += [(":WAV:SOUR %s" % source, QUERY_NONE), (":WAV:PRE?", QUERY_ASCII)]
+        response = self.commands(batch)
+        preambles = dict((source, parse_preamble(response[5 + 2*i])) for i, source in enumerate(sources))
+        total = sum(preamble['points'] for preamble in preambles.values())
+        timestamp = time.time()
+
+        data = {}
+        done = [0]
+        for source in sources:
+            preamble = preambles[source]
+            sink = ArraySink(preamble['points'])
+            def progress(count, size):
+                if cancel != None and cancel.is_set():
+                    raise OperationCancelled("Cancelled after %d of %d bytes." % (done[0] + count, total))
+                if callback:
+                    callback(done[0] + count, total)
+            self.command(":WAV:SOUR %s" % source)
+            self.__read_data(sink, chunk_size, progress)
+            done[0] += sink.count
+            raw = sink.data[:sink.count]
+            if source in self.pods:
+                for i, channel in enumerate(self.pods[source].channels):
+                    data[channel.name] = (raw >> i) & 1
+            else:
+                data[source] = (raw - preamble['yreference'])*preamble['yincrement'] + preamble['yorigin']
+        if not done[0]:
+            raise Exception("No data returned.  Waveform buffer is empty.")
+
+        preamble = preambles[sources[0]]
+        t = preamble['xorigin'] + preamble['xincrement']*(numpy.arange(len(data[names[waveforms[0]]])) - preamble['xreference'])
+        capture = Capture(t, dict((waveform, data[names[waveform]]) for waveform in waveforms), timestamp)
+        if archive != None:
+            archive.add(capture)
+        return capture
+
+    def decode_bus(self, clock, edge=RISING, cs=None, cs_active=0, data_bits=None, points=1000):
+        '''
+        Acquire both pods and sample them as a 16 bit parallel bus.  See ParallelBusAnalyzer.
+
+        Channels can be given by name or label.  Returns a list of BusWords.
+        '''
+        def bit(channel):
+            return None if channel == None else self[channel].name
+        t, pod1, pod2 = self.read_pods(points)
+        if data_bits != None:
+            data_bits = map(bit, data_bits)
+        return ParallelBusAnalyzer(t, pod1, pod2, bit(clock), edge, bit(cs), cs_active, data_bits).transfers()
+
+    def decode_uart(self, rx='RX', baud=None, bits=8, parity=None, stop_bits=1, inverted=False, points=1000):
+        '''
+        Acquire and decode an asynchronous serial line.  See UARTAnalyzer.  Requires numpy.
+        '''
+        t, channels = self.acquire((rx,), points=points)
+        analyzer = UARTAnalyzer(t, channels[rx], baud, bits, parity, stop_bits, inverted)
+        return analyzer.frames()
+
+    def decode(self, decoders, points=1000, index=None):
+        '''
+        Acquire once and run several protocol decoders over the capture.
+
+        decoders is a list of (name, protocol, options), where options is a dictionary of
+        DecodePipeline.add() options, eg: ('eeprom', 'i2c', {'sda' : 'SDA', 'scl' : 'SCL'}).
+        Returns a time-ordered list of (time, name, transaction or frame) events.  If index (a
+        TransactionIndex) is provided, the capture is archived and the events indexed.
+        '''
+        pipeline = DecodePipeline()
+        for name, protocol, options in decoders:
+            pipeline.add(name, protocol, **options)
+        t, waveforms = self.acquire(pipeline.channels(), points=points)
+        events = pipeline.run(t, waveforms)
+        if index != None:
+            index.add(Capture(t, waveforms), events)
+        return events
+
     def show(self, transaction):
         self[X1].pos = transaction.timebase[0]
         self[X2].pos = transaction.timebase[-1]
@@ -796,6 +1175,7 @@ class Scope(Instrument):
 
     def reset(self):
         self.command("*RST")
+        self.invalidate_labels()
 
     @property
     def trigger(self):
@@ -818,18 +1198,35 @@ class Scope(Instrument):
 
     def __set_setup(self, setup_data):
         self.command(":SYST:SET #8%08d%s" % (len(setup_data), setup_data))
+        self.invalidate_labels()
 
     setup = property(__get_setup, __set_setup, doc="System setup data  (binary format)")
 
 
-    def save_setup(self, filename=None):
-        if not filename:
+    def save_setup(self, filename=None, name=None):
+        '''
+        Save the scope setup.  If name is provided, the decoded setup is stored under that
+        name in the setup library (self.setups), otherwise the binary setup data is saved.
+        '''
+        if name:
+            self.setups.save(name)
+        elif not filename:
             self.saved_setup = self.setup
         else:
             with open(filename, 'wb') as fp:
                 fp.write(self.setup)
 
-    def restore_setup(self, filename=None):
+    def restore_setup(self, filename=None, name=None):
+        '''
+        Restore the scope setup.  If name is provided, the named setup from the setup library is
+        restored by sending only the settings that differ from the current ones.  Otherwise the
+        full binary setup data is sent.
+        '''
+        if name:
+            commands = self.setups.recall(name)
+            if [command for command in commands if ":LAB " in command]:
+                self.invalidate_labels()
+            return commands
         if filename:
             with open(filename, 'rb') as fp:
                 self.setup = fp.read()
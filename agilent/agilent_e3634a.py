@@ -1,5 +1,8 @@
-from common import Instrument, format_number as fmt
+from common import Instrument, QUERY_ASCII, format_number as fmt
+from collections import deque
 import serial
+import threading
+import time
 
 def normalize(l, minimum=-1.0, maximum=1.0):
     M,m = float(max(l)),float(min(l))
@@ -7,10 +10,31 @@ def normalize(l, minimum=-1.0, maximum=1.0):
     target_range = float(maximum-minimum)
     return [((x-m)/input_range)*target_range + minimum for x in l]
 
+def ramp_profile(start, stop, steps=10, dwell=0.1):
+    '''
+    Profile that steps the voltage from start to stop in equal steps, dwell seconds apart
+    '''
+    return [(i*dwell, start + (stop-start)*i/float(steps)) for i in range(steps+1)]
+
+def step_profile(levels, dwell=0.1):
+    '''
+    Profile that steps through a list of voltages (or (voltage, current) pairs), dwell seconds apart
+    '''
+    return [(i*dwell,) + (level if isinstance(level, tuple) else (level,)) for i, level in enumerate(levels)]
+
+def margin_profile(nominal, margins=(-5, 0, 5), dwell=1.0):
+    '''
+    Profile that steps through voltages the provided percentages above and below nominal
+    '''
+    return step_profile([nominal*(1 + margin/100.0) for margin in margins], dwell)
+
 class PowerSupply(Instrument): 
 
-    def __init__(self,port="COM1",baud=9600, timeout=5, verbose=False):
-        Instrument.__init__(self, port, baud, timeout, verbose)
+    MIRRORED_QUERIES = ("VOLT", "CURR")
+    MIRROR_INVALIDATORS = Instrument.MIRROR_INVALIDATORS + ("APPL",)
+
+    def __init__(self,port="COM1",baud=9600, timeout=5, verbose=False, connect=True, offline=False):
+        Instrument.__init__(self, port, baud, timeout, verbose, connect=connect, offline=offline)
 
     def apply(self, voltage, current):
         self.command("APPL %s,%s" % (voltage, current))
@@ -27,6 +51,48 @@ class PowerSupply(Instrument):
         return float(self.query("CURR?"))
     current = property(__get_current, __set_current)
 
+    def run_profile(self, profile, cancel=None):
+        '''
+        Run a voltage profile: a list of (time, voltage) or (time, voltage, current) steps, with
+        times in seconds from the start.  The commands are worked out up front and sent without
+        any round trips in between.  See ramp_profile(), step_profile() and margin_profile()
+        '''
+        commands = []
+        for step in profile:
+            commands.append((step[0], "VOLT %s" % fmt(step[1])))
+            if len(step) > 2:
+                commands.append((step[0], "CURR %s" % fmt(step[2])))
+        self.schedule(commands, cancel=cancel)
+
+    def ramp(self, start, stop, steps=10, dwell=0.1):
+        self.run_profile(ramp_profile(start, stop, steps, dwell))
+
+    def monitor(self, interval=0.05, count=None, duration=None, samples=None, stop=None):
+        '''
+        Measure the output voltage and current every interval seconds.
+
+        Stops after count samples, duration seconds, or when the stop event gets set.  Each sample
+        is a single compound query, and the port is only held for that query, so the supply can be
+        used from other threads (eg: to run a profile) while it is monitored.  Samples are (time,
+        voltage, current) and are appended to samples, which defaults to a new ring buffer of the
+        last 10000 samples.
+        '''
+        samples = deque(maxlen=10000) if samples == None else samples
+        self.errors()
+        start = next = time.time()
+        n = 0
+        while count == None or n < count:
+            if (duration != None and time.time() - start >= duration) or (stop != None and stop.is_set()):
+                break
+            timestamp = time.time()
+            voltage, current = self.commands([("MEAS:VOLT?;:MEAS:CURR?", QUERY_ASCII)], check=False)[0].split(';')
+            samples.append((timestamp, float(voltage), float(current)))
+            n += 1
+            next += interval
+            time.sleep(max(0, next - time.time()))
+        self.errors(True)
+        return samples
+
     def output(self, b):
         if b:
             self.command("OUTPUT ON")
@@ -44,3 +110,35 @@ class PowerSupply(Instrument):
     def __get_message(self, msg):
         return self.query("DISP:TEXT?")
     message = property(__get_message, __set_message)
+
+class SupplyLogger(threading.Thread):
+    '''
+    Background thread that logs a power supply's output voltage and current into a ring buffer.
+
+    samples holds the last size (time, voltage, current) samples.  See PowerSupply.monitor()
+    '''
+    def __init__(self, supply, interval=0.05, size=10000):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.supply = supply
+        self.interval = interval
+        self.samples = deque(maxlen=size)
+        self.error = None
+        self.__stop = threading.Event()
+
+    def run(self):
+        try:
+            self.supply.monitor(interval=self.interval, samples=self.samples, stop=self.__stop)
+        except Exception, e:
+            self.error = e
+
+    def stop(self, wait=True):
+        self.__stop.set()
+        if wait:
+            self.join()
+
+    def since(self, timestamp):
+        '''
+        Return the samples taken at or after timestamp
+        '''
+        return [sample for sample in list(self.samples) if sample[0] >= timestamp]
@@ -0,0 +1,198 @@
+from __future__ import with_statement
+import os
+import time
+import warnings
+
+class Capture(object):
+    '''
+    A single acquisition's worth of waveforms that share a common timebase.
+    '''
+    def __init__(self, timebase, waveforms, timestamp=None):
+        self.timebase = timebase
+        self.waveforms = waveforms
+        self.timestamp = time.time() if timestamp == None else timestamp
+
+    def __str__(self):
+        return "<Capture of %s, %d points @ %s>" % (", ".join(map(str, self.waveforms.keys())), len(self.timebase), time.ctime(self.timestamp))
+
+    def __repr__(self):
+        return str(self)
+
+    def __getitem__(self, key):
+        return self.waveforms[key]
+
+    def __contains__(self, key):
+        return key in self.waveforms
+
+    def keys(self):
+        return self.waveforms.keys()
+
+    def __iter__(self):
+        # Unpacks like the (t, data) tuple returned by Scope.acquire()
+        return iter((self.timebase, self.waveforms))
+
+    def save(self, filename):
+        '''
+        Save the capture as a numpy .npz file.  Requires numpy.
+        '''
+        import numpy
+        arrays = dict(("waveform:%s" % key, numpy.asarray(value)) for key, value in self.waveforms.items())
+        with open(filename, 'wb') as fp:
+            numpy.savez(fp, timebase=numpy.asarray(self.timebase), timestamp=numpy.asarray(self.timestamp), **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Load a capture saved with save().  Requires numpy.
+        '''
+        import numpy
+        data = numpy.load(filename)
+        try:
+            waveforms = dict((key.split(':', 1)[1], data[key]) for key in data.files if key.startswith("waveform:"))
+            return cls(data['timebase'], waveforms, float(data['timestamp']))
+        finally:
+            data.close()
+
+class CaptureArchive(object):
+    '''
+    A directory of saved captures, one .npz file each, named by timestamp.
+    '''
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __str__(self):
+        return "<CaptureArchive at %s: %d captures>" % (self.path, len(self))
+
+    def __repr__(self):
+        return str(self)
+
+    def __filename(self, timestamp):
+        return os.path.join(self.path, "%.6f.npz" % timestamp)
+
+    def timestamps(self):
+        return sorted(float(f[:-4]) for f in os.listdir(self.path) if f.endswith(".npz"))
+
+    def __len__(self):
+        return len(self.timestamps())
+
+    def __iter__(self):
+        for timestamp in self.timestamps():
+            yield self.get(timestamp)
+
+    def add(self, capture):
+        '''
+        Save a capture in the archive.  Returns the filename.
+        '''
+        filename = self.__filename(capture.timestamp)
+        capture.save(filename)
+        return filename
+
+    def get(self, timestamp):
+        return Capture.load(self.__filename(timestamp))
+
+    def between(self, start, end):
+        '''
+        Return the captures taken between start and end (inclusive)
+        '''
+        return [self.get(timestamp) for timestamp in self.timestamps() if start <= timestamp <= end]
+
+class CaptureHistory(object):
+    '''
+    Ring buffer of the most recent captures, with a fixed memory footprint.
+
+    Holds the last frames captures, or as many as fit in max_bytes.  The buffers are allocated
+    when the first capture is added, for its waveforms and number of points.  Adding a capture is
+    O(1) and overwrites the oldest one once full.  If a capture with different waveforms or a
+    different number of points is added, the history is cleared and reallocated for it, with a
+    warning.  Requires numpy.
+    '''
+    def __init__(self, frames=None, max_bytes=None, dtype='float64'):
+        if frames == None and max_bytes == None:
+            raise ValueError("Capture history needs a number of frames or a maximum size.")
+        self.frames = frames
+        self.requested_frames = frames
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.keys = None
+        self.head = 0
+        self.count = 0
+
+    def __str__(self):
+        return "<CaptureHistory of %d/%s captures>" % (self.count, self.frames)
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return self.count
+
+    def __allocate(self, capture):
+        import numpy
+        self.keys = sorted(capture.keys())
+        points = len(capture.timebase)
+        frame_bytes = (len(self.keys) + 1)*points*numpy.dtype(self.dtype).itemsize + 8
+        frames = self.requested_frames
+        if self.max_bytes != None:
+            frames = min(frames or self.max_bytes, max(1, self.max_bytes // frame_bytes))
+        self.frames = frames
+        self.timestamps = numpy.zeros(frames)
+        self.timebases = numpy.zeros((frames, points), dtype=self.dtype)
+        self.data = numpy.zeros((frames, len(self.keys), points), dtype=self.dtype)
+        self.head = 0
+        self.count = 0
+
+    def append(self, capture):
+        if self.keys == None:
+            self.__allocate(capture)
+        if sorted(capture.keys()) != self.keys or len(capture.timebase) != self.timebases.shape[1]:
+            warnings.warn("Capture history cleared: waveforms or number of points changed from %s x %d to %s x %d."
+                          % (", ".join(map(str, self.keys)), self.timebases.shape[1], ", ".join(map(str, sorted(capture.keys()))), len(capture.timebase)))
+            self.__allocate(capture)
+        self.timestamps[self.head] = capture.timestamp
+        self.timebases[self.head] = capture.timebase
+        for i, key in enumerate(self.keys):
+            self.data[self.head, i] = capture[key]
+        self.head = (self.head + 1) % self.frames
+        self.count = min(self.count + 1, self.frames)
+
+    def __index(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("Capture history index out of range")
+        return (self.head - self.count + i) % self.frames
+
+    def __getitem__(self, i):
+        '''
+        Return capture i, oldest first.  The capture's data is copied out of the history.
+        '''
+        j = self.__index(i)
+        waveforms = dict((key, self.data[j, k].copy()) for k, key in enumerate(self.keys))
+        return Capture(self.timebases[j].copy(), waveforms, float(self.timestamps[j]))
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def between(self, start, end):
+        '''
+        Return the captures taken between start and end (inclusive), oldest first
+        '''
+        return [self[i] for i in range(self.count) if start <= self.timestamps[self.__index(i)] <= end]
+
+    def around(self, timestamp, before=1.0, after=1.0):
+        '''
+        Return the captures taken from before seconds before timestamp to after seconds after it
+        '''
+        return self.between(timestamp - before, timestamp + after)
+
+    def dump(self, archive, timestamp, before=1.0, after=1.0):
+        '''
+        Save the captures around timestamp to archive (a CaptureArchive).  Returns the number saved.
+        '''
+        captures = self.around(timestamp, before, after)
+        for capture in captures:
+            archive.add(capture)
+        return len(captures)
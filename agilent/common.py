@@ -1,16 +1,215 @@
 from __future__ import with_statement 
+import os
+import re
+import threading
 import time
 import serial
+from stats import InstrumentStats, MeteredPort, metered
 
 QUERY_NONE = 0
 QUERY_ASCII = 1
 QUERY_BINARY = 2
-    
+
+class OperationTimeout(Exception):
+    pass
+
+class OperationCancelled(Exception):
+    pass
+
+def read_block(port, fp=None, chunk_size=4096, callback=None):
+    '''
+    Read an IEEE 488.2 definite length block (#<digits><size><data>) from port.
+
+    The data is read in chunks of up to chunk_size bytes.  If fp is provided, each chunk is
+    written to it as it arrives and the size of the block is returned, otherwise the block is
+    returned as a string.  callback, if provided, is called as callback(bytes_read, size) after
+    every chunk.  If callback raises (eg: OperationCancelled), the rest of the block is read and
+    thrown away before the exception is passed on, so the next response starts at the right place.
+    '''
+    pound = port.read(1)
+    # Skip over the terminator of any previous response
+    while pound in ("\r", "\n"):
+        pound = port.read(1)
+    if pound != "#": raise Exception("Unexpected response in binary query.")
+    try: digits = int(port.read(1))
+    except: raise Exception("Could not read binary query header.")
+    try: size = int(port.read(digits))
+    except: raise Exception("Could not read binary query block size.")
+
+    chunks = []
+    count = 0
+    while count < size:
+        chunk = port.read(min(chunk_size, size-count))
+        if not chunk:
+            raise Exception("Timed out reading binary block (%d of %d bytes)." % (count, size))
+        count += len(chunk)
+        if fp == None:
+            chunks.append(chunk)
+        else:
+            fp.write(chunk)
+        if callback:
+            try:
+                callback(count, size)
+            except:
+                discard(port, size - count, chunk_size)
+                raise
+    if fp == None:
+        return ''.join(chunks)
+    return size
+
+def discard(port, size, chunk_size=4096):
+    '''
+    Read and throw away the rest of a response: size bytes of block data and its terminator.
+    Stops early if the port times out.
+    '''
+    while size > 0:
+        chunk = port.read(min(chunk_size, size))
+        if not chunk:
+            return
+        size -= len(chunk)
+    port.read(1)
+
+class ArraySink(object):
+    '''
+    File-like sink for read_block() that copies each chunk into a preallocated numpy byte array,
+    so a large block is never built up as a string.  Requires numpy.
+    '''
+    def __init__(self, size):
+        import numpy
+        self.data = numpy.zeros(size, dtype=numpy.uint8)
+        self.count = 0
+
+    def write(self, chunk):
+        import numpy
+        if self.count + len(chunk) > len(self.data):
+            raise Exception("Binary block is larger than the %d bytes expected." % len(self.data))
+        self.data[self.count:self.count+len(chunk)] = numpy.frombuffer(chunk, dtype=numpy.uint8)
+        self.count += len(chunk)
+
+def open_tiff(tiff_data):
+    '''
+    Create a PIL image from TIFF image data.  Requires PIL.
+    '''
+    import ImageFile
+    p = ImageFile.Parser()
+    p.feed(tiff_data)
+    return p.close()
+
+def tiff_to_png(tiff_data):
+    '''
+    Convert TIFF image data to PNG image data.  Requires PIL.
+    '''
+    from StringIO import StringIO
+    im = open_tiff(tiff_data)
+    fp = StringIO()
+    im.save(fp, "PNG")
+    value = fp.getvalue()
+    fp.close()
+    return value
+
+class StateMirror(object):
+    '''
+    Client-side copy of instrument settings, keyed by SCPI header (eg: 'TIM:SCAL')
+
+    Only the headers it is created with are mirrored.  Values are stored as the strings that
+    were written or read, with any units stripped from numeric values, so that they parse the
+    same way as the instrument's own responses.  dependencies maps a header to the mirrored
+    headers whose values the instrument may change (or clamp) when it is written.
+    '''
+    URQ = 64 # Standard event status register: a front-panel key has been pressed
+
+    def __init__(self, headers, check_interval=None, dependencies={}):
+        self.headers = set(map(StateMirror.header, headers))
+        self.dependencies = dict([(StateMirror.header(header), map(StateMirror.header, dependents))
+                                  for header, dependents in dependencies.items()])
+        self.values = {}
+        self.check_interval = check_interval
+        self.last_checked = time.time()
+
+    def __str__(self):
+        return "<StateMirror of %d/%d settings>" % (len(self.values), len(self.headers))
+
+    def __repr__(self):
+        return str(self)
+
+    @staticmethod
+    def header(command):
+        return command.strip().split(None, 1)[0].lstrip(':').rstrip('?').upper()
+
+    def read(self, query):
+        '''
+        Return the mirrored response to query, or None if it isn't known.
+        '''
+        if len(query.strip().split(None, 1)) > 1:
+            return None
+        return self.values.get(StateMirror.header(query))
+
+    def write(self, command):
+        parts = command.strip().split(None, 1)
+        for header in self.dependencies.get(StateMirror.header(command), []):
+            self.values.pop(header, None)
+        if len(parts) == 2:
+            self.update(parts[0], parts[1])
+
+    def update(self, header, value):
+        header = StateMirror.header(header)
+        if header in self.headers:
+            value = value.strip()
+            number = value.split()
+            if len(number) == 2 and number[1].isalpha():
+                try:
+                    float(number[0])
+                    value = number[0]
+                except ValueError:
+                    pass
+            self.values[header] = value
+
+    def invalidate(self, header=None):
+        if header == None:
+            self.values.clear()
+        else:
+            self.values.pop(StateMirror.header(header), None)
+
+    def stale(self):
+        return self.check_interval != None and time.time() - self.last_checked > self.check_interval
+
+def summarize(command, length=80):
+    '''
+    Shorten a command for verbose output, leaving out the contents of any binary block
+    '''
+    block = re.search(r"#([1-9])", command)
+    if block:
+        return "'%s...' <%d bytes>" % (command[:block.end() + int(block.group(1))], len(command))
+    if len(command) > length:
+        return "'%s...' <%d bytes>" % (command[:length//2], len(command))
+    return "'%s'" % command
+
+def exclusive(f):
+    '''
+    Decorator for Instrument methods that use the serial port, so that only one thread at a time does.
+    '''
+    def wrapper(self, *args, **kwargs):
+        with self.port_lock:
+            return f(self, *args, **kwargs)
+    wrapper.__name__ = f.__name__
+    wrapper.__doc__ = f.__doc__
+    return wrapper
+
 class Instrument(object):
     '''
     Abstract baseclass for Agilent HPIB Instruments that can chat over RS-232
     '''
-    def __init__(self,port="COM1",baud=57600, timeout=5, verbose=False, rtscts=True, dsrdtr=False, stopbits=serial.STOPBITS_ONE):
+    # Settings (SCPI headers) that can be served from the state mirror
+    MIRRORED_QUERIES = ()
+    # Commands that change settings behind the mirror's back (matched by header prefix)
+    MIRROR_INVALIDATORS = ("*RST", "*RCL")
+    # Commands that change other mirrored settings as a side effect: header -> affected headers
+    MIRROR_DEPENDENCIES = {}
+    # Whether the instrument flags front-panel key presses in its standard event status register
+    FRONT_PANEL_EVENTS = False
+
+    def __init__(self,port="COM1",baud=57600, timeout=5, verbose=False, rtscts=True, dsrdtr=False, stopbits=serial.STOPBITS_ONE,
+                 connect=True, offline=False):
         """
         Creates a connection to the serial port with the specified settings.
         
@@ -18,55 +217,105 @@ class Instrument(object):
         baudRate -> Baud rate. Possible values: 9600, 19200, 38400, or 57600
         timeout -> Maximum time in seconds to wait for scope to respond.
                    Possible values: an int >= 0
+        connect -> If False, the serial port isn't opened until it is first used.
+        offline -> If True, the serial port is never opened, and anything that needs it raises.
         """
+        self.mirror = None
+        self.stats = None
+        # Held while the port is in use, so instruments can be shared between threads
+        self.port_lock = threading.RLock()
         self.comPortName=port
         self.baudRate=baud
         self.timeout=timeout
-
-        self.port=serial.Serial(port=self.comPortName,baudrate=self.baudRate,timeout=self.timeout, rtscts=rtscts, dsrdtr=dsrdtr, stopbits=stopbits)
-        self.port.setRtsCts(rtscts)
-        self.port.flush()
-        self.port.flushInput()
-        self.port.close()
+        self.rtscts = rtscts
+        self.dsrdtr = dsrdtr
+        self.stopbits = stopbits
+        self.offline = offline
         self.verbose = verbose
 
+        self.__port = None
+        if connect and not offline:
+            self.connect()
+
+    def connect(self):
+        '''
+        Open the serial port and clear out its buffers.  Called on first use of the port if the
+        instrument was created with connect=False.
+        '''
+        if self.offline:
+            raise Exception("%s is offline." % self.comPortName)
+        port = serial.Serial(port=self.comPortName,baudrate=self.baudRate,timeout=self.timeout, rtscts=self.rtscts, dsrdtr=self.dsrdtr, stopbits=self.stopbits)
+        port.setRtsCts(self.rtscts)
+        port.flush()
+        port.flushInput()
+        port.close()
+        self.__port = port
+
+    def __get_port(self):
+        if self.__port == None:
+            self.connect()
+        return self.__port
+    def __set_port(self, port):
+        self.__port = port
+    port = property(__get_port, __set_port)
+
+    @property
+    def connected(self):
+        return self.__port != None
+
     def query(self,query,type=QUERY_ASCII):
+        if self.mirror != None and type == QUERY_ASCII:
+            if self.mirror.stale():
+                self.check_front_panel()
+            value = self.mirror.read(query)
+            if value != None:
+                return value
         return self.commands(((query, type),))[0]
 
     def command(self,command):
         self.commands(((command,False),))
 
-    def commands(self, commands):
-        self.errors()
+    @exclusive
+    @metered("commands")
+    def commands(self, commands, check=True):
+        '''
+        Execute a batch of (command, query type) pairs, and return the responses.
+
+        If check is set, the error queue is drained before the batch and checked afterwards.
+        Otherwise the queue is left alone, so that errors can be checked after several batches.
+        '''
+        if check:
+            self.errors()
         self.port.open()
         self.port.flush()
         self.port.write("\n")
         #self.errors()
         result = None
         # Make sure we clear the scope output before executing commands
-        commands = [("*CLS", QUERY_NONE)] + list(commands) 
+        prefix = [("*CLS", QUERY_NONE)] if check else []
+        if self.mirror != None and self.FRONT_PANEL_EVENTS:
+            prefix.insert(0, ("*ESR?", QUERY_ASCII))
+        commands = prefix + list(commands)
         result = []
+        # Binary blocks are followed by a newline that isn't part of the block
+        unterminated = False
         try:
             for command, query in commands:
                 if self.verbose:
-                    print "--> '%s'" % command
+                    print "--> %s" % summarize(command)
                 self.port.write(command+"\n")
                 if query == QUERY_ASCII:
                     s = self.port.readline().strip()
+                    if not s and unterminated:
+                        s = self.port.readline().strip()
+                    unterminated = False
                     if self.verbose:
                         print "<-- '%s'" % s
                     result.append(s)
                 elif query == QUERY_BINARY:
-                    pound, digits = self.port.read(2)
-                    if pound != "#": raise Exception("Unexpected response in binary query.")
-                    try: digits =int(digits)
-                    except: raise Exception("Could not read binary query header.")
-                    try: size = int(self.port.read(digits))
-                    except: raise Exception("Could not read binary query block size.")
-                    binstring = ''
-                    while len(binstring) < size:
-                        binstring += self.port.read()
+                    binstring = read_block(self.port)
                     result.append(binstring)
+                    unterminated = True
                     if self.verbose:
                         if len(binstring) > 0:
                             print "<-- <%d bytes of binary data>" % len(binstring)
@@ -74,13 +323,164 @@ class Instrument(object):
                     result.append(None)
         except:
             self.port.close()
+            self.invalidate_mirror()
             raise
         self.port.close()
-        self.errors(True)
-        return result[1:]
+        if check:
+            try:
+                self.errors(True)
+            except:
+                self.invalidate_mirror()
+                raise
+        if self.mirror != None:
+            self.__update_mirror(commands, result, result[0] if self.FRONT_PANEL_EVENTS else None)
+        return result[len(prefix):]
+
+    def __update_mirror(self, commands, result, esr=None):
+        mirror = self.mirror
+        if esr != None:
+            mirror.last_checked = time.time()
+            try:
+                if int(esr) & StateMirror.URQ:
+                    mirror.invalidate()
+            except ValueError:
+                mirror.invalidate()
+        for (command, query), response in zip(commands, result):
+            header = StateMirror.header(command)
+            if query == QUERY_NONE and [x for x in self.MIRROR_INVALIDATORS if header.startswith(x.lstrip(':'))]:
+                mirror.invalidate()
+            elif query == QUERY_NONE:
+                mirror.write(command)
+            elif query == QUERY_ASCII and len(command.split()) == 1:
+                mirror.update(header, response)
+
+    def enable_mirror(self, snapshot=True, check_interval=None):
+        '''
+        Start serving reads of instrument settings from a client-side mirror.
+
+        Settings written through the library are recorded in the mirror as they are written.  If
+        snapshot is set, all mirrored settings are read from the instrument in one batch up front.
+        On instruments that report front-panel key presses, the mirror is invalidated when one is
+        seen, and check_interval sets how often (in seconds) a read from the mirror checks for them.
+        '''
+        if check_interval != None and not self.FRONT_PANEL_EVENTS:
+            raise ValueError("%s doesn't report front-panel activity, so check_interval can't be used" % self.__class__.__name__)
+        self.mirror = StateMirror(self.MIRRORED_QUERIES, check_interval=check_interval,
+                                  dependencies=self.MIRROR_DEPENDENCIES)
+        if snapshot:
+            self.snapshot()
+        return self.mirror
+
+    def disable_mirror(self):
+        self.mirror = None
+
+    def invalidate_mirror(self):
+        if self.mirror != None:
+            self.mirror.invalidate()
+
+    def snapshot(self):
+        '''
+        Read all of the mirrored settings from the instrument in one batch.  Returns a dictionary of header -> value.
+        '''
+        headers = list(self.MIRRORED_QUERIES)
+        values = self.commands([(header + "?", QUERY_ASCII) for header in headers])
+        return dict(zip(headers, values))
+
+    def check_front_panel(self):
+        '''
+        Check for front-panel activity, invalidating the mirror if there has been any.
+        '''
+        self.commands([], check=False)
+
+    @metered("schedule")
+    def schedule(self, commands, cancel=None):
+        '''
+        Send a precomputed list of (time, command) pairs, each at its time in seconds from the start.
+
+        The port is only held while commands are being sent, so other threads (eg: a SupplyLogger)
+        can use the instrument in between.  Commands that are due together are sent together, and
+        the error queue is only checked at the end.  Raises OperationCancelled if the cancel event
+        gets set part way through.
+        '''
+        commands = sorted(commands, key=lambda x: x[0])
+        self.errors()
+        sent = []
+        try:
+            start = time.time()
+            while len(sent) < len(commands):
+                while time.time() < start + commands[len(sent)][0]:
+                    if cancel != None and cancel.is_set():
+                        raise OperationCancelled("Cancelled after %d of %d commands." % (len(sent), len(commands)))
+                    time.sleep(min(0.01, max(0, start + commands[len(sent)][0] - time.time())))
+                with self.port_lock:
+                    self.port.open()
+                    try:
+                        if not sent:
+                            self.port.write("*CLS\n")
+                        while len(sent) < len(commands) and time.time() >= start + commands[len(sent)][0]:
+                            t, command = commands[len(sent)]
+                            if self.verbose:
+                                print "--> %s @ %gs" % (summarize(command), t)
+                            self.port.write(command + "\n")
+                            sent.append((command, QUERY_NONE))
+                    finally:
+                        self.port.close()
+        except:
+            self.invalidate_mirror()
+            raise
+        try:
+            self.errors(True)
+        except:
+            self.invalidate_mirror()
+            raise
+        if self.mirror != None:
+            self.__update_mirror(sent, [None]*len(sent))
+
+    def enable_stats(self, trace=None):
+        '''
+        Start recording latency and traffic statistics for the serial port (see InstrumentStats).
+
+        trace, if set, is a file-like object that every command is logged to.
+        '''
+        self.disable_stats()
+        self.stats = InstrumentStats(trace)
+        self.port = MeteredPort(self.port, self.stats)
+        return self.stats
+
+    def disable_stats(self):
+        if self.stats != None:
+            self.port = self.port.port
+            self.stats = None
+
+    @exclusive
+    @metered("operation_complete")
+    def operation_complete(self, timeout=None, interval=0.05, cancel=None):
+        '''
+        Wait for all pending operations to finish, using *OPC?
+
+        The port is checked for a response every interval seconds.  Raises OperationTimeout if
+        nothing comes back within timeout seconds, or OperationCancelled if the cancel event
+        (eg: a threading.Event) gets set while waiting.
+        '''
+        start = time.time()
+        port_timeout = self.port.timeout
+        self.port.open()
+        try:
+            self.port.write("*OPC?\n")
+            self.port.timeout = interval
+            while not self.port.readline().strip():
+                if cancel != None and cancel.is_set():
+                    raise OperationCancelled("Cancelled while waiting for operation to complete.")
+                if timeout != None and time.time() - start > timeout:
+                    raise OperationTimeout("Timed out waiting for operation to complete.")
+        finally:
+            self.port.timeout = port_timeout
+            self.port.close()
 
     def reset(self):
         self.command("*RST")
+    @exclusive
+    @metered("errors")
     def errors(self, raise_errors=False):
         """
         Returns all errors from the scope's error queue.
@@ -119,3 +519,63 @@ class PNGImage(object):
 
     def _repr_png_(self):
         return self.image_data
+
+class TIFFImage(object):
+    '''
+    Wrapper for TIFF image data that is ipython-notebook formattable
+
+    The conversion to PNG only happens when the PNG data is first asked for, or in the
+    background if convert() is called with wait=False.
+    '''
+    def __init__(self, tiff_data):
+        self.tiff_data = tiff_data
+        self.__png_data = None
+        self.__worker = None
+        self.__error = None
+
+    def convert(self, wait=True):
+        '''
+        Convert the image to PNG.  If wait is set, the conversion is done now and the PNG data
+        returned, otherwise it's started in the background.  Any error in the conversion is
+        raised here (with wait set) or from image_data.
+        '''
+        if self.__png_data == None and self.__error == None:
+            if self.__worker != None:
+                if wait:
+                    self.__worker.join()
+            elif wait:
+                self.__convert()
+            else:
+                self.__worker = threading.Thread(target=self.__convert)
+                self.__worker.daemon = True
+                self.__worker.start()
+        if wait and self.__error != None:
+            raise self.__error
+        return self.__png_data
+
+    def __convert(self):
+        try:
+            self.__png_data = tiff_to_png(self.tiff_data)
+        except Exception, e:
+            self.__error = e
+
+    def __get_image_data(self):
+        return self.convert()
+    image_data = property(__get_image_data, doc="PNG image data")
+
+    def save(self, filename):
+        '''
+        Save the image.  The format is picked from the file extension.  TIFF data is written as-is.
+        '''
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in ('.tif', '.tiff'):
+            with open(filename, 'wb') as fp:
+                fp.write(self.tiff_data)
+        elif extension == '.png':
+            with open(filename, 'wb') as fp:
+                fp.write(self.image_data)
+        else:
+            open_tiff(self.tiff_data).save(filename)
+
+    def _repr_png_(self):
+        return self.image_data
@@ -0,0 +1,270 @@
+'''
+Host-side waveform measurements, computed from acquired data with numpy.
+
+These mirror the scope's own :MEAS measurements (see AnalogChannel), but work on any number of
+waveforms at once: y can be a single waveform, or an array of waveforms with samples along the
+last axis (eg: captures x channels x samples), all sharing the timebase t.  Results have the shape
+of y without its last axis.  Measurements that can't be made are NaN.
+
+Thresholds follow the scope's defaults: 10%, 50% and 90% of the way from base to top.  Percentage
+measurements (duty_cycle, overshoot, undershoot) are in percent, like the scope's.
+'''
+import numpy
+
+RISING = 1
+FALLING = -1
+
+LOWER = 0.1
+MIDDLE = 0.5
+UPPER = 0.9
+
+BINS = 256
+
+def _rows(y):
+    y = numpy.asarray(y, dtype=float)
+    return y.reshape((-1, y.shape[-1])), y.shape[:-1]
+
+def _levels(rows, level):
+    return numpy.resize(numpy.asarray(level, dtype=float), rows.shape[0])
+
+def _times(t, positions):
+    t = numpy.asarray(t, dtype=float)
+    return numpy.interp(positions, numpy.arange(len(t)), t)
+
+class Crossings(object):
+    '''
+    Interpolated threshold crossings for every row of a 2-D array, in row order then time order.
+
+    row is the row each crossing belongs to, position is its fractional sample index, and key
+    (row * samples + position) sorts crossings across all rows, for vectorized lookups.
+    '''
+    def __init__(self, rows, level, direction):
+        level = _levels(rows, level)
+        above = rows > level[:, None]
+        if direction == RISING:
+            mask = ~above[:, :-1] & above[:, 1:]
+        elif direction == FALLING:
+            mask = above[:, :-1] & ~above[:, 1:]
+        else:
+            mask = above[:, :-1] != above[:, 1:]
+        self.row, index = numpy.nonzero(mask)
+        y0 = rows[self.row, index]
+        y1 = rows[self.row, index+1]
+        self.position = index + (level[self.row] - y0)/(y1 - y0)
+        self.key = self.row*rows.shape[1] + self.position
+        self.count = numpy.bincount(self.row, minlength=rows.shape[0])
+        self.first = numpy.searchsorted(self.row, numpy.arange(rows.shape[0]), 'left')
+        self.last = numpy.searchsorted(self.row, numpy.arange(rows.shape[0]), 'right') - 1
+
+    def first_position(self):
+        '''
+        Position of the first crossing in each row (NaN for rows without any)
+        '''
+        retval = numpy.empty(len(self.count))
+        retval.fill(numpy.nan)
+        has = self.count > 0
+        retval[has] = self.position[self.first[has]]
+        return retval
+
+    def before(self, key, row):
+        '''
+        Index of the last crossing before each key in the same row, or -1
+        '''
+        i = numpy.searchsorted(self.key, key) - 1
+        if not len(self.key):
+            return i
+        valid = (i >= 0) & (self.row[numpy.maximum(i, 0)] == row)
+        return numpy.where(valid, i, -1)
+
+    def after(self, key, row, side='right'):
+        '''
+        Index of the first crossing after each key in the same row, or -1
+
+        With side='left', a crossing exactly at the key counts as being after it.
+        '''
+        i = numpy.searchsorted(self.key, key, side)
+        if not len(self.key):
+            return i - 1
+        valid = (i < len(self.key)) & (self.row[numpy.minimum(i, len(self.key)-1)] == row)
+        return numpy.where(valid, i, -1)
+
+def crossings(t, y, level, direction=None):
+    '''
+    Return the interpolated times at which a single waveform crosses level.
+
+    direction is RISING, FALLING or None for both.
+    '''
+    rows, shape = _rows(y)
+    c = Crossings(rows, level, direction)
+    return _times(t, c.position)
+
+def top_base(y, bins=BINS):
+    '''
+    Return the top and base of the waveforms: the most common values in the upper and lower halves
+    of their range, as the mean of the samples in the fullest histogram bin of each half.
+    '''
+    rows, shape = _rows(y)
+    high = rows.max(axis=1)
+    low = rows.min(axis=1)
+    span = numpy.where(high > low, high - low, 1.0)
+    bin = numpy.minimum(((rows - low[:, None])/span[:, None]*bins).astype(int), bins-1)
+    # One histogram per row, computed in a single bincount by offsetting each row's bins
+    offset = numpy.arange(len(rows))[:, None]*bins
+    counts = numpy.bincount((bin + offset).ravel(), minlength=len(rows)*bins).reshape((len(rows), bins))
+    sums = numpy.bincount((bin + offset).ravel(), weights=rows.ravel(), minlength=len(rows)*bins).reshape((len(rows), bins))
+    half = bins//2
+    index = numpy.arange(len(rows))
+    top_bin = half + counts[:, half:].argmax(axis=1)
+    base_bin = counts[:, :half].argmax(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        top = sums[index, top_bin]/counts[index, top_bin]
+        base = sums[index, base_bin]/counts[index, base_bin]
+    top = numpy.where(high > low, top, high)
+    base = numpy.where(high > low, base, low)
+    return top.reshape(shape), base.reshape(shape)
+
+def _period(t, c):
+    period = numpy.empty(len(c.count))
+    period.fill(numpy.nan)
+    has = c.count > 1
+    start = _times(t, c.position[c.first[has]])
+    end = _times(t, c.position[c.last[has]])
+    period[has] = (end - start)/(c.count[has] - 1)
+    return period
+
+def _width(t, starts, ends, rows):
+    # Average time from each start crossing to the next end crossing in the same row
+    i = ends.after(starts.key, starts.row)
+    valid = i >= 0
+    widths = _times(t, ends.position[i[valid]]) - _times(t, starts.position[valid])
+    total = numpy.bincount(starts.row[valid], weights=widths, minlength=rows)
+    count = numpy.bincount(starts.row[valid], minlength=rows)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(count > 0, total/numpy.maximum(count, 1), numpy.nan)
+
+def _edge_time(t, first, second):
+    # Time from the first 'first' crossing in each row to the next 'second' crossing
+    rows = len(first.count)
+    retval = numpy.empty(rows)
+    retval.fill(numpy.nan)
+    has = numpy.nonzero(first.count > 0)[0]
+    if len(has) == 0:
+        return retval
+    key = first.key[first.first[has]]
+    i = second.after(key, has)
+    valid = i >= 0
+    a = _times(t, first.position[first.first[has[valid]]])
+    b = _times(t, second.position[i[valid]])
+    retval[has[valid]] = b - a
+    return retval
+
+def measure(t, y, items=None):
+    '''
+    Measure waveforms.  items are measurement names as used by AnalogChannel.measure() (phase
+    excepted) and default to all of them.  Returns a dictionary of name -> measurement(s).
+    '''
+    rows, shape = _rows(y)
+    items = items or ('max', 'min', 'avg', 'amplitude', 'top', 'base', 'frequency', 'period', 'duty_cycle',
+                      'pwidth', 'nwidth', 'rise_time', 'fall_time', 'overshoot', 'undershoot')
+    retval = {}
+    vmax = rows.max(axis=1)
+    vmin = rows.min(axis=1)
+    top, base = top_base(rows)
+    amplitude = top - base
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        values = {'max' : lambda: vmax,
+                  'min' : lambda: vmin,
+                  'avg' : lambda: rows.mean(axis=1),
+                  'top' : lambda: top,
+                  'base' : lambda: base,
+                  'amplitude' : lambda: amplitude,
+                  'overshoot' : lambda: (vmax - top)/amplitude*100.0,
+                  'undershoot' : lambda: (base - vmin)/amplitude*100.0}
+        cache = {}
+        def crossing(fraction, direction):
+            if (fraction, direction) not in cache:
+                cache[(fraction, direction)] = Crossings(rows, base + fraction*amplitude, direction)
+            return cache[(fraction, direction)]
+        values['period'] = lambda: _period(t, crossing(MIDDLE, RISING))
+        values['frequency'] = lambda: 1.0/values['period']()
+        values['pwidth'] = lambda: _width(t, crossing(MIDDLE, RISING), crossing(MIDDLE, FALLING), len(rows))
+        values['nwidth'] = lambda: _width(t, crossing(MIDDLE, FALLING), crossing(MIDDLE, RISING), len(rows))
+        values['duty_cycle'] = lambda: values['pwidth']()/values['period']()*100.0
+        values['rise_time'] = lambda: _edge_time(t, crossing(LOWER, RISING), crossing(UPPER, RISING))
+        values['fall_time'] = lambda: _edge_time(t, crossing(UPPER, FALLING), crossing(LOWER, FALLING))
+        for item in items:
+            if item not in values:
+                raise ValueError("%s is not a valid measurement.  Must be one of %s" % (item, sorted(values)))
+            retval[item] = values[item]().reshape(shape)
+    return retval
+
+def phase(t, a, b):
+    '''
+    Phase of b relative to a, in degrees, measured between rising edges at 50% of each waveform's amplitude.
+
+    Results are in the range -180 to 180, negative when b leads a.
+    '''
+    a, shape = _rows(a)
+    b, shape = _rows(b)
+    top, base = top_base(a)
+    ca = Crossings(a, base + MIDDLE*(top-base), RISING)
+    top, base = top_base(b)
+    cb = Crossings(b, base + MIDDLE*(top-base), RISING)
+    period = _period(t, ca)
+    start = ca.first_position()
+    retval = numpy.empty(len(a))
+    retval.fill(numpy.nan)
+    has = numpy.nonzero(~numpy.isnan(start))[0]
+    i = cb.after(has*a.shape[1] + start[has], has, 'left')
+    valid = i >= 0
+    rows = has[valid]
+    delay = _times(t, cb.position[i[valid]]) - _times(t, start[rows])
+    retval[rows] = (delay/period[rows]*360.0 + 180.0) % 360.0 - 180.0
+    return retval.reshape(shape)
+
+def measure_captures(captures, waveforms, items=None):
+    '''
+    Measure the same waveforms in a number of captures (see Capture) that share a timebase.
+
+    Returns a dictionary of name -> array of measurements, indexed by [capture, waveform].
+    '''
+    captures = list(captures)
+    y = numpy.array([[capture[waveform] for waveform in waveforms] for capture in captures], dtype=float)
+    return measure(captures[0].timebase, y, items)
+
+def middle(y):
+    '''
+    The level half way between a waveform's minimum and maximum
+    '''
+    y = numpy.asarray(y, dtype=float)
+    return (y.max() + y.min())/2.0
+
+def setup_hold(t, data, clock, direction=RISING, data_level=None, clock_level=None):
+    '''
+    Setup and hold times of data around each clock edge in direction (RISING, FALLING or None).
+
+    Setup is the time from the last data edge before each clock edge, hold the time to the first
+    data edge after it, both from interpolated crossings of each waveform's middle level (or the
+    levels provided).  Returns arrays of setup and hold times, NaN where there is no data edge.
+    '''
+    data_edges = crossings(t, data, middle(data) if data_level == None else data_level)
+    clock_edges = crossings(t, clock, middle(clock) if clock_level == None else clock_level, direction)
+    i = numpy.searchsorted(data_edges, clock_edges)
+    setup = numpy.empty(len(clock_edges))
+    setup.fill(numpy.nan)
+    hold = setup.copy()
+    before = i > 0
+    setup[before] = clock_edges[before] - data_edges[i[before]-1]
+    after = i < len(data_edges)
+    hold[after] = data_edges[i[after]] - clock_edges[after]
+    return setup, hold
+
+def statistics(values):
+    '''
+    Count, min, max, mean and standard deviation of values, ignoring NaNs
+    '''
+    values = numpy.asarray(values, dtype=float)
+    values = values[~numpy.isnan(values)]
+    if not len(values):
+        return {'count' : 0, 'min' : None, 'max' : None, 'mean' : None, 'std' : None}
+    return {'count' : len(values), 'min' : values.min(), 'max' : values.max(), 'mean' : values.mean(), 'std' : values.std()}
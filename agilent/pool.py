@@ -0,0 +1,138 @@
+import sys
+import threading
+from common import OperationTimeout, OperationCancelled
+
+class InstrumentPool(object):
+    '''
+    A group of instruments, each on its own serial port, that are driven concurrently.
+
+    Every instrument gets its own worker thread for the duration of a call, so the
+    time taken to talk to N instruments is roughly the time taken by the slowest one.
+    '''
+    def __init__(self, instruments=()):
+        self.instruments = list(instruments)
+
+    def __str__(self):
+        return "<InstrumentPool of %d instruments>" % len(self)
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def __iter__(self):
+        return iter(self.instruments)
+
+    def __getitem__(self, i):
+        return self.instruments[i]
+
+    def add(self, instrument):
+        self.instruments.append(instrument)
+
+    def map(self, function, *args, **kwargs):
+        '''
+        Call function(instrument, *args, **kwargs) for every instrument in the pool at once.
+
+        Blocks until every call has finished, and returns the results in pool order.  If
+        any of the calls raised, the first failure (in pool order) is re-raised once all
+        of the other calls have completed.
+        '''
+        results = [None]*len(self.instruments)
+        errors = [None]*len(self.instruments)
+
+        def worker(i, instrument):
+            try:
+                results[i] = function(instrument, *args, **kwargs)
+            except:
+                errors[i] = sys.exc_info()
+
+        threads = []
+        for i, instrument in enumerate(self.instruments):
+            thread = threading.Thread(target=worker, args=(i, instrument))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        for error in errors:
+            if error:
+                raise error[0], error[1], error[2]
+        return results
+
+    def call(self, method, *args, **kwargs):
+        '''
+        Call the named method on every instrument in the pool at once.
+        '''
+        return self.map(lambda instrument: getattr(instrument, method)(*args, **kwargs))
+
+    def single(self):
+        '''
+        Arm every scope in the pool for a single acquisition.
+        '''
+        self.call('single')
+
+    def digitize(self):
+        '''
+        Start a digitize on every scope in the pool.
+        '''
+        self.call('digitize')
+
+    def acquire(self, waveforms, points=1000):
+        '''
+        Read waveforms from every scope in the pool.  Returns a list of (t, data) tuples in pool order.
+        '''
+        return self.call('acquire', waveforms, points=points)
+
+    def wait(self, timeout=None, interval=0.05):
+        '''
+        Wait for every scope in the pool to finish its acquisition.
+        '''
+        self.call('wait_for_acquisition', timeout=timeout, interval=interval)
+
+    def wait_any(self, timeout=None, interval=0.05):
+        '''
+        Wait for the first scope in the pool to finish its acquisition, and return it.
+
+        The others are left armed.
+        '''
+        done = threading.Event()
+        finished = []
+        def wait(scope):
+            try:
+                scope.wait_for_acquisition(timeout=timeout, interval=interval, cancel=done)
+            except OperationCancelled:
+                return
+            except OperationTimeout:
+                if not finished:
+                    raise
+                return
+            finished.append(scope)
+            done.set()
+        self.map(wait)
+        return finished[0]
+
+    def arm(self):
+        '''
+        Arm all of the scopes.  Returns once every scope has been armed.
+        '''
+        self.single()
+
+    def collect(self, waveforms, points=1000, timeout=None):
+        '''
+        Collect the waveforms from all of the scopes armed by arm().
+
+        Each scope is read out as soon as its own acquisition completes.
+        '''
+        def collect(scope):
+            scope.wait_for_acquisition(timeout=timeout)
+            return scope.acquire(waveforms, points=points)
+        return self.map(collect)
+
+    def capture(self, waveforms, points=1000, timeout=None):
+        '''
+        Arm all scopes, then collect from all scopes.
+        '''
+        self.arm()
+        return self.collect(waveforms, points=points, timeout=timeout)
@@ -1,11 +1,36 @@
 import agilent
+import bisect
+import itertools
+
+class EdgeCache(object):
+    '''
+    Digitized waveforms and edges, shared by analyzers decoding the same capture.
+
+    Results are keyed by the identity of the waveform they were computed from, so analyzers
+    sharing a cache must be given the same waveform lists.  The cache holds on to them.
+    '''
+    def __init__(self):
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, kind, waveform, compute):
+        key = (kind, id(waveform))
+        if key not in self.entries:
+            self.entries[key] = (waveform, compute())
+        return self.entries[key][1]
+
+# Edge names, as for the trigger slope, to measurements directions
+_DIRECTIONS = {'POS' : 1, 'NEG' : -1, None : None}
 
 class LogicAnalyzer(object):
 
-    def __init__(self, timebase):
+    def __init__(self, timebase, cache=None):
         self.timebase = timebase
         self.waveforms = {}
         self.digitized_waveforms = {}
+        self.cache = EdgeCache() if cache == None else cache
 
     def slice(self, start, end):
         a = self.index(start)
@@ -24,9 +49,10 @@ class LogicAnalyzer(object):
         self.waveforms[key] = value
 
         # Digitize the waveform, store that as well
-        avg = (max(value)-min(value))/2.0
-        waveform = [1 if x > avg else 0 for x in value]
-        self.digitized_waveforms[key] = waveform
+        def digitize():
+            avg = (max(value)-min(value))/2.0
+            return [1 if x > avg else 0 for x in value]
+        self.digitized_waveforms[key] = self.cache.get('digitized', value, digitize)
 
     def __getitem__(self, key):
         return self.waveforms[key]
@@ -36,32 +62,62 @@ class LogicAnalyzer(object):
             if edge > time: return edge
         return None
 
-    def rising_edges(self, key):
-        retval = []
+    def __pairs(self, key):
+        # (time, sample, next sample) for each sample but the last
         waveform = self.digitized_waveforms[key]
-        for i in range(len(waveform)-1):
-            if waveform[i] < waveform[i+1]:
-                retval.append(self.timebase[i])
-        return retval
+        return itertools.izip(self.timebase, waveform, itertools.islice(waveform, 1, None))
+
+    def rising_edges(self, key):
+        compute = lambda: [t for t, a, b in self.__pairs(key) if a < b]
+        return list(self.cache.get('rising', self.digitized_waveforms[key], compute))
 
     def falling_edges(self, key):
-        retval = []
-        waveform = self.digitized_waveforms[key]
-        for i in range(len(waveform)-1):
-            if waveform[i] > waveform[i+1]:
-                retval.append(self.timebase[i])
-        return retval
+        compute = lambda: [t for t, a, b in self.__pairs(key) if a > b]
+        return list(self.cache.get('falling', self.digitized_waveforms[key], compute))
 
     def edges(self, key):
         '''
         Return the time from the timebase at which the provided waveform transitions from high to low or low to high.
         '''
-        retval = []
-        waveform = self.digitized_waveforms[key]
-        for i in range(len(waveform)-1):
-            if waveform[i] > waveform[i+1] or waveform[i] < waveform[i+1]:
-                retval.append(self.timebase[i])
-        return retval
+        compute = lambda: [t for t, a, b in self.__pairs(key) if a != b]
+        return list(self.cache.get('edges', self.digitized_waveforms[key], compute))
+
+    def edge_times(self, key, edge=None):
+        '''
+        Return the times at which the provided waveform crosses the middle of its range,
+        interpolated between samples.  edge is 'POS' (rising), 'NEG' (falling) or None (both).
+        Requires numpy.
+        '''
+        import measurements
+        waveform = self.waveforms[key]
+        compute = lambda: measurements.crossings(self.timebase, waveform, measurements.middle(waveform), _DIRECTIONS[edge])
+        return self.cache.get(('edge_times', edge), waveform, compute)
+
+    def clock_gaps(self, key, edge=None):
+        '''
+        Return the times between successive (interpolated) edges of a waveform.  Requires numpy.
+        '''
+        import numpy
+        return numpy.diff(self.edge_times(key, edge))
+
+    def setup_hold(self, data, clock, edge='POS'):
+        '''
+        Return arrays of the setup and hold times of data around each of clock's edges, from
+        interpolated edge times.  See measurements.setup_hold().  Requires numpy.
+        '''
+        import measurements
+        return measurements.setup_hold(self.timebase, self.waveforms[data], self.waveforms[clock], _DIRECTIONS[edge])
+
+    def timing(self, data, clock, edge='POS'):
+        '''
+        Setup time, hold time and clock gap statistics (count, min, max, mean and std) for data
+        sampled on clock's edges.  Requires numpy.
+        '''
+        import measurements
+        setup, hold = self.setup_hold(data, clock, edge)
+        return {'setup' : measurements.statistics(setup),
+                'hold' : measurements.statistics(hold),
+                'clock_gaps' : measurements.statistics(self.clock_gaps(clock))}
     
     def high_ranges(self, key):
         retval = []
@@ -149,8 +205,8 @@ class I2CTransaction(object):
 
 class I2CAnalyzer(LogicAnalyzer):
 
-    def __init__(self, timebase, sda, scl):
-        LogicAnalyzer.__init__(self, timebase)
+    def __init__(self, timebase, sda, scl, cache=None):
+        LogicAnalyzer.__init__(self, timebase, cache)
         self['SDA'] = sda
         self['SCL'] = scl
 
@@ -217,22 +273,28 @@ class I2CAnalyzer(LogicAnalyzer):
         return retval
 
 class SPITransaction(object):
-    def __init__(self, outbound, inbound, mode, analyzer):
+    def __init__(self, outbound, inbound, mode, analyzer, cs_times=None, sample_edge=None):
         if len(outbound) != len(inbound): raise Exception("Inbound and outbound data sizes do not match!")
         self.outbound = outbound
         self.inbound = inbound 
         self.mode = mode
         self.analyzer = analyzer
         self.timebase = analyzer.timebase
-        clock_edges = analyzer.edges('SCK')
+        self.sample_edge = sample_edge
+        # Interpolated edge times if numpy is available, otherwise the samples before each edge
+        try:
+            clock_edges = list(analyzer.edge_times('SCK'))
+        except ImportError:
+            clock_edges = analyzer.edges('SCK')
+        start, end = cs_times or (analyzer.timebase[0], analyzer.timebase[-1])
         clock_gaps = []
         for i in range(len(clock_edges)-1):
             clock_gaps.append(clock_edges[i+1] - clock_edges[i])
         self.min_sck_time = min(clock_gaps)
         self.max_sck_time = max(clock_gaps)
-        self.cs_lead_time = clock_edges[0] - analyzer.timebase[0]
-        self.cs_lag_time = analyzer.timebase[-1] - clock_edges[-1]
-        self.data_rate = len(inbound)*8/(analyzer.timebase[-1] - analyzer.timebase[0])
+        self.cs_lead_time = clock_edges[0] - start
+        self.cs_lag_time = end - clock_edges[-1]
+        self.data_rate = len(inbound)*8/(end - start)
 
     def pretty(self):
         
@@ -265,6 +327,18 @@ class SPITransaction(object):
         return 1 if self.mode & 1 else 0
     pha = property(_get_pha)
 
+    def timing(self):
+        '''
+        Setup and hold time statistics for MOSI and MISO around the edges SCK is sampled on, plus
+        SCK gap statistics, from interpolated edge times.  See LogicAnalyzer.timing().  Requires numpy.
+        '''
+        edge = self.sample_edge or 'POS'
+        mosi = self.analyzer.timing('MOSI', 'SCK', edge)
+        miso = self.analyzer.timing('MISO', 'SCK', edge)
+        return {'mosi_setup' : mosi['setup'], 'mosi_hold' : mosi['hold'],
+                'miso_setup' : miso['setup'], 'miso_hold' : miso['hold'],
+                'sck_gaps' : mosi['clock_gaps']}
+
     def __getitem__(self, i):
         return (self.outbound[i], self.inbound[i])
 
@@ -272,13 +346,13 @@ class SPITransaction(object):
         return iter(zip(self.outbound, self.inbound))
 
 class SPIAnalyzer(LogicAnalyzer):
-    def __init__(self, t, miso, mosi, sck, cs, mode=None):
-        LogicAnalyzer.__init__(self, t)
+    def __init__(self, t, miso, mosi, sck, cs, mode=None, cache=None):
+        LogicAnalyzer.__init__(self, t, cache)
         self['MISO'] = miso
         self['MOSI'] = mosi
         self['SCK'] = sck
         self['CS'] = cs
-        self.mode = None
+        self.mode = mode
 
     def transaction_ranges(self):
         return self.low_ranges('CS')
@@ -294,6 +368,20 @@ class SPIAnalyzer(LogicAnalyzer):
 
         def nearest_difference(p,l):
             return min([abs(p-x) for x in l])
+
+        def cs_times(analyzer):
+            # Interpolated CS falling and rising edges around a transaction, if numpy is available
+            try:
+                falling = self.edge_times('CS', 'NEG')
+                rising = self.edge_times('CS', 'POS')
+            except ImportError:
+                return None
+            # CS falls just before the first sample of the transaction and rises just after the last
+            i = bisect.bisect_right(falling, analyzer.timebase[0])
+            j = bisect.bisect_left(rising, analyzer.timebase[-1])
+            if i == 0 or j == len(rising):
+                return None
+            return falling[i-1], rising[j]
         
         for analyzer in self.transaction_analyzers():
             rising_clock = analyzer.rising_edges('SCK')
@@ -301,44 +389,50 @@ class SPIAnalyzer(LogicAnalyzer):
             if len(rising_clock) == 0 or len(falling_clock) == 0:
                 raise Exception("No clock edges detected.")
 
-            miso_edges = analyzer.edges('MISO')
-            mosi_edges = analyzer.edges('MOSI')
-            try:
-                miso_rising = sum([nearest_difference(x, rising_clock) for x in miso_edges])/len(miso_edges)
-                miso_falling = sum([nearest_difference(x, falling_clock) for x in miso_edges])/len(miso_edges)
-                miso_mode = 2 if miso_rising < miso_falling else 0
-            except:
-                miso_mode = 0
+            if self.mode != None:
+                # CPOL in bit 1, CPHA in bit 0
+                pol, pha = self.mode & 2, self.mode & 1
+            else:
+                miso_edges = analyzer.edges('MISO')
+                mosi_edges = analyzer.edges('MOSI')
+                try:
+                    miso_rising = sum([nearest_difference(x, rising_clock) for x in miso_edges])/len(miso_edges)
+                    miso_falling = sum([nearest_difference(x, falling_clock) for x in miso_edges])/len(miso_edges)
+                    miso_mode = 2 if miso_rising < miso_falling else 0
+                except:
+                    miso_mode = 0
             
-            try:
-                mosi_rising = sum([nearest_difference(x, rising_clock) for x in mosi_edges])/len(mosi_edges)
-                mosi_falling = sum([nearest_difference(x, falling_clock) for x in mosi_edges])/len(mosi_edges)
-                mosi_mode = 2 if mosi_rising < mosi_falling else 0
-            except:
-                mosi_mode = 0
+                try:
+                    mosi_rising = sum([nearest_difference(x, rising_clock) for x in mosi_edges])/len(mosi_edges)
+                    mosi_falling = sum([nearest_difference(x, falling_clock) for x in mosi_edges])/len(mosi_edges)
+                    mosi_mode = 2 if mosi_rising < mosi_falling else 0
+                except:
+                    mosi_mode = 0
             
-            if miso_mode == None and mosi_mode != None: miso_mode = mosi_mode
-            if mosi_mode == None and miso_mode != None: mosi_mode = miso_mode
-
-            if miso_mode != mosi_mode:
-                raise ValueError("Outbound and Inbound SPI modes do not match!  Master and slave are operating in different modes!")
-            pha = miso_mode 
-            start = analyzer.state("SCK", analyzer.timebase[0]) 
-            end = analyzer.state("SCK", analyzer.timebase[-1]) 
-            if start:
-                pol = 1
-                pha = 2 if pha == 0 else 1
-            elif not start and not end:
-                pol = 0
-            else:
-                raise ValueError("Clock phase could not be detected from the input waveform!")
+                if miso_mode == None and mosi_mode != None: miso_mode = mosi_mode
+                if mosi_mode == None and miso_mode != None: mosi_mode = miso_mode
+
+                if miso_mode != mosi_mode:
+                    raise ValueError("Outbound and Inbound SPI modes do not match!  Master and slave are operating in different modes!")
+                pha = miso_mode 
+                start = analyzer.state("SCK", analyzer.timebase[0]) 
+                end = analyzer.state("SCK", analyzer.timebase[-1]) 
+                if start:
+                    pol = 1
+                    pha = 2 if pha == 0 else 1
+                elif not start and not end:
+                    pol = 0
+                else:
+                    raise ValueError("Clock phase could not be detected from the input waveform!")
             
             inbound=[]
             outbound = []
             if bool(pol) != bool(pha):
+                sample_edge = 'NEG'
                 inbound_bits = [1 if analyzer.state('MISO', x) else 0 for x in analyzer.falling_edges("SCK")]
                 outbound_bits  = [1 if analyzer.state('MOSI', x) else 0 for x in analyzer.falling_edges("SCK")]
             else:
+                sample_edge = 'POS'
                 inbound_bits = [1 if analyzer.state('MISO', x) else 0 for x in analyzer.rising_edges("SCK")]
                 outbound_bits  = [1 if analyzer.state('MOSI', x) else 0 for x in analyzer.rising_edges("SCK")]
             if len(inbound_bits) % 8 != 0:
@@ -348,6 +442,353 @@ class SPIAnalyzer(LogicAnalyzer):
                 inbound.append(self._bitlist_to_byte(inbound_bits[i:i+8]))
                 outbound.append(self._bitlist_to_byte(outbound_bits[i:i+8]))
                 i+=8
-            retval.append(SPITransaction(outbound, inbound, pol | pha, analyzer))
+            retval.append(SPITransaction(outbound, inbound, pol | pha, analyzer, cs_times(analyzer), sample_edge))
         return retval
 
+
+BAUD_RATES = (300, 600, 1200, 2400, 4800, 9600, 14400, 19200, 28800, 38400, 57600, 76800, 115200, 230400, 250000, 460800, 500000, 921600, 1000000, 2000000, 3000000)
+
+class UARTFrame(object):
+    def __init__(self, value, start, end, parity_error=False, framing_error=False):
+        self.value = value
+        self.start = start
+        self.end = end
+        self.parity_error = parity_error
+        self.framing_error = framing_error
+
+    def __str__(self):
+        errors = ""
+        if self.parity_error: errors += " PARITY"
+        if self.framing_error: errors += " FRAMING"
+        return "<UART 0x%02x @ %gs%s>" % (self.value, self.start, errors)
+
+    def __repr__(self):
+        return str(self)
+
+def _threshold(value):
+    return (value.max() + value.min())/2.0
+
+def _digitize(value, inverted=False, threshold=None):
+    import numpy
+    value = numpy.asarray(value, dtype=float)
+    if threshold == None:
+        threshold = _threshold(value)
+    digitized = (value > threshold).astype(numpy.int8)
+    return 1 - digitized if inverted else digitized
+
+def _detect_baud(t, d):
+    # The shortest runs between edges are single bits.  Average the ones close to the shortest.
+    import numpy
+    edges = numpy.nonzero(d[:-1] != d[1:])[0]
+    if len(edges) < 2:
+        raise Exception("Not enough edges to detect the baud rate.")
+    gaps = numpy.diff(t[edges])
+    gaps = gaps[gaps > 0]
+    bit_time = gaps[gaps < 1.5*gaps.min()].mean()
+    baud = 1.0/bit_time
+    nearest = min(BAUD_RATES, key=lambda rate: abs(rate-baud))
+    return nearest if abs(nearest-baud) < 0.05*nearest else baud
+
+def _decode_uart(t, d, baud, bits, parity, stop_bits):
+    '''
+    Decode the frames in a digitized line (idle high).  Returns the frames, and the index of the
+    first sample that isn't part of a complete frame.
+    '''
+    import numpy
+    bit_time = 1.0/baud
+    count = 1 + bits + (parity != None) + stop_bits
+    falling = numpy.nonzero((d[:-1] == 1) & (d[1:] == 0))[0]
+    edge_times = (t[falling] + t[falling+1])/2.0
+
+    # Each start bit is the first falling edge after the middle of the previous frame's last stop bit
+    starts = []
+    i = 0
+    while i < len(falling):
+        starts.append(i)
+        i = numpy.searchsorted(edge_times, edge_times[i] + (count-0.5)*bit_time)
+    starts = numpy.array(starts, dtype=int)
+    if not len(starts):
+        return [], len(d)-1
+
+    # Sample every bit of every frame in the middle of the bit
+    positions = edge_times[starts][:, None] + (numpy.arange(count) + 0.5)*bit_time
+    complete = positions[:, -1] <= t[-1]
+    consumed = falling[starts[~complete][0]] if not complete.all() else len(d)-1
+    starts, positions = starts[complete], positions[complete]
+    samples = d[numpy.minimum(numpy.searchsorted(t, positions), len(d)-1)]
+
+    valid = samples[:, 0] == 0
+    data = samples[:, 1:1+bits]
+    values = (data.astype(int) << numpy.arange(bits)).sum(axis=1)
+    ones = data.sum(axis=1)
+    if parity == None:
+        parity_errors = numpy.zeros(len(samples), dtype=bool)
+    else:
+        expected = {'even' : ones % 2, 'odd' : 1 - ones % 2, 'mark' : 1, 'space' : 0}[parity]
+        parity_errors = samples[:, 1+bits] != expected
+    framing_errors = (samples[:, count-stop_bits:] == 0).any(axis=1)
+
+    frames = []
+    for i in numpy.nonzero(valid)[0]:
+        start = edge_times[starts[i]]
+        frames.append(UARTFrame(int(values[i]), start, start + count*bit_time, bool(parity_errors[i]), bool(framing_errors[i])))
+    return frames, consumed
+
+class UARTAnalyzer(LogicAnalyzer):
+    '''
+    Decodes an asynchronous serial line.  Requires numpy.
+
+    The line is idle high unless inverted is set.  If baud is None, it is detected from the
+    shortest pulses in the capture.  parity is None, 'even', 'odd', 'mark' or 'space'.
+    '''
+    def __init__(self, timebase, rx, baud=None, bits=8, parity=None, stop_bits=1, inverted=False, cache=None):
+        LogicAnalyzer.__init__(self, timebase, cache)
+        self.waveforms['RX'] = rx
+        self.digitized_waveforms['RX'] = self.cache.get(('uart', inverted), rx, lambda: _digitize(rx, inverted))
+        self.bits = bits
+        self.parity = parity
+        self.stop_bits = stop_bits
+        self.inverted = inverted
+        self.__baud = baud
+
+    def __timebase(self):
+        import numpy
+        return self.cache.get('array', self.timebase, lambda: numpy.asarray(self.timebase, dtype=float))
+
+    def __get_baud(self):
+        if self.__baud == None:
+            self.__baud = _detect_baud(self.__timebase(), self.digitized_waveforms['RX'])
+        return self.__baud
+    baud = property(__get_baud)
+
+    def frames(self):
+        frames, consumed = _decode_uart(self.__timebase(), self.digitized_waveforms['RX'],
+                                        self.baud, self.bits, self.parity, self.stop_bits)
+        return frames
+
+    def data(self):
+        '''
+        The decoded bytes as a string
+        '''
+        return "".join(chr(frame.value & 0xff) for frame in self.frames())
+
+class UARTStream(object):
+    '''
+    Decodes an asynchronous serial line that arrives in consecutive chunks (eg: a deep memory
+    readout), carrying partial frames over from one chunk to the next.  Requires numpy.
+
+    The baud rate is detected from the first chunk if it isn't provided.
+    '''
+    def __init__(self, baud=None, bits=8, parity=None, stop_bits=1, inverted=False):
+        self.baud = baud
+        self.bits = bits
+        self.parity = parity
+        self.stop_bits = stop_bits
+        self.inverted = inverted
+        self.threshold = None
+        self.t = None
+        self.d = None
+
+    def feed(self, t, rx):
+        '''
+        Add the next chunk of samples.  Returns the frames completed by it.
+        '''
+        import numpy
+        t = numpy.asarray(t, dtype=float)
+        rx = numpy.asarray(rx, dtype=float)
+        if self.threshold == None:
+            if rx.max() == rx.min():
+                # Nothing but idle line so far
+                self.t, self.d = t[-1:], numpy.ones(1, dtype=numpy.int8)
+                return []
+            self.threshold = _threshold(rx)
+        d = _digitize(rx, self.inverted, self.threshold)
+        if self.t is not None:
+            t = numpy.concatenate((self.t, t))
+            d = numpy.concatenate((self.d, d))
+        if self.baud == None:
+            self.baud = _detect_baud(t, d)
+        frames, consumed = _decode_uart(t, d, self.baud, self.bits, self.parity, self.stop_bits)
+        self.t, self.d = t[consumed:], d[consumed:]
+        return frames
+
+class BusWord(object):
+    def __init__(self, value, time):
+        self.value = value
+        self.time = time
+
+    def __str__(self):
+        return "<Bus 0x%04x @ %gs>" % (self.value, self.time)
+
+    def __repr__(self):
+        return str(self)
+
+def _bit_number(channel):
+    # Digital channel names (eg: 'DIG12') or bit numbers
+    if channel == None or isinstance(channel, int):
+        return channel
+    return int(str(channel).upper().replace("DIG", ""))
+
+class ParallelBusAnalyzer(object):
+    '''
+    Treats the digital channels as a parallel bus, clocked by one of them.  Requires numpy.
+
+    pod1 and pod2 are the raw pod data, one byte per sample (as read with Scope.read_pods()), and
+    are packed straight into 16 bit words, DIG0 in bit 0 to DIG15 in bit 15, without unpacking
+    the individual channels.  The bus is sampled on the clock channel's edges: edge is 'POS'
+    (rising), 'NEG' (falling) or None (both), as for the trigger slope.  If cs is set, only edges
+    where cs is at the cs_active level count.  data_bits are the bits that make up the bus value,
+    least significant first, and default to every channel but the clock and cs.
+    '''
+    def __init__(self, timebase, pod1, pod2=None, clock=None, edge="POS", cs=None, cs_active=0, data_bits=None):
+        import numpy
+        self.timebase = numpy.asarray(timebase, dtype=float)
+        words = self.__bytes(pod1).astype(numpy.uint16)
+        if pod2 is not None:
+            words |= self.__bytes(pod2).astype(numpy.uint16) << 8
+        self.words = words
+        self.clock = _bit_number(clock)
+        self.edge = edge
+        self.cs = _bit_number(cs)
+        self.cs_active = cs_active
+        width = 16 if pod2 is not None else 8
+        if data_bits == None:
+            data_bits = [bit for bit in range(width) if bit not in (self.clock, self.cs)]
+        self.data_bits = map(_bit_number, data_bits)
+        if not self.data_bits:
+            raise ValueError("No data bits given for the bus.")
+        invalid = [bit for bit in self.data_bits if not 0 <= bit < width]
+        if invalid:
+            raise ValueError("Data bits %s are out of range: the bus has %d channels." % (invalid, width))
+
+    @staticmethod
+    def __bytes(data):
+        import numpy
+        if isinstance(data, str):
+            return numpy.frombuffer(data, dtype=numpy.uint8)
+        return numpy.asarray(data, dtype=numpy.uint8)
+
+    def bit(self, bit):
+        '''
+        The samples of one channel, as an array of 0s and 1s
+        '''
+        return (self.words >> _bit_number(bit)) & 1
+
+    def sample(self):
+        '''
+        Sample the bus.  Returns arrays of the sample times and the bus values.
+        '''
+        import numpy
+        if self.clock == None:
+            index = numpy.arange(len(self.words))
+        else:
+            clock = self.bit(self.clock)
+            if self.edge == "POS":
+                edges = (clock[:-1] == 0) & (clock[1:] == 1)
+            elif self.edge == "NEG":
+                edges = (clock[:-1] == 1) & (clock[1:] == 0)
+            else:
+                edges = clock[:-1] != clock[1:]
+            if self.cs != None:
+                edges &= self.bit(self.cs)[:-1] == self.cs_active
+            # Like the other analyzers, take the state just before the edge
+            index = numpy.nonzero(edges)[0]
+        words = self.words[index]
+        bits = self.data_bits
+        if bits == range(bits[0], bits[0] + len(bits)):
+            values = (words >> bits[0]) & ((1 << len(bits)) - 1)
+        else:
+            values = numpy.zeros(len(words), dtype=numpy.uint16)
+            for i, bit in enumerate(bits):
+                values |= ((words >> bit) & 1) << i
+        return self.timebase[index], values
+
+    def values(self):
+        return [int(value) for value in self.sample()[1]]
+
+    def transfers(self):
+        times, values = self.sample()
+        return [BusWord(int(value), float(time)) for time, value in zip(times, values)]
+
+PROTOCOLS = {'i2c' : ('sda', 'scl'),
+             'spi' : ('miso', 'mosi', 'sck', 'cs'),
+             'uart' : ('rx',)}
+
+# Analyzer options (besides the signals) that each protocol accepts
+PROTOCOL_OPTIONS = {'i2c' : (),
+                    'spi' : ('mode',),
+                    'uart' : ('baud', 'bits', 'parity', 'stop_bits', 'inverted')}
+
+def _tolist(x):
+    # The analyzers index and search their timebases and waveforms as lists, not numpy arrays
+    return x.tolist() if hasattr(x, 'tolist') else x
+
+class DecodePipeline(object):
+    '''
+    Runs several protocol decoders over one capture, merging their results into a single
+    time-ordered list of (time, decoder name, transaction or frame) events.
+
+    The decoders share an EdgeCache, so each waveform is digitized, and its edges found, once
+    however many decoders use it.  The timebase and waveforms can be lists or numpy arrays (eg:
+    from a Capture loaded from a CaptureArchive); arrays are converted to lists for the analyzers.
+    '''
+    def __init__(self, timebase=None, waveforms=None):
+        self.decoders = []
+        self.load(timebase, waveforms)
+
+    def load(self, timebase, waveforms):
+        '''
+        Set the capture to decode.
+        '''
+        self.timebase = _tolist(timebase)
+        self.waveforms = None if waveforms is None else dict((key, _tolist(value)) for key, value in waveforms.items())
+        self.cache = EdgeCache()
+
+    def add(self, name, protocol, **options):
+        '''
+        Add a decoder.  protocol is one of PROTOCOLS, and options name the waveforms for each of
+        the protocol's signals (eg: sda='SDA', scl='SCL'), plus any other analyzer options (eg:
+        baud=115200 for a UART, or mode=3 for SPI).  See PROTOCOL_OPTIONS.
+        '''
+        if protocol not in PROTOCOLS:
+            raise ValueError("%s is not a supported protocol.  Must be one of %s" % (protocol, sorted(PROTOCOLS)))
+        missing = [signal for signal in PROTOCOLS[protocol] if signal not in options]
+        if missing:
+            raise ValueError("No waveform given for %s" % ", ".join(missing))
+        unknown = [option for option in options if option not in PROTOCOLS[protocol] + PROTOCOL_OPTIONS[protocol]]
+        if unknown:
+            raise TypeError("%s decoders don't accept %s" % (protocol, ", ".join(sorted(unknown))))
+        self.decoders.append((name, protocol, options))
+
+    def channels(self):
+        '''
+        The waveforms the decoders need
+        '''
+        retval = []
+        for name, protocol, options in self.decoders:
+            for signal in PROTOCOLS[protocol]:
+                if options[signal] not in retval:
+                    retval.append(options[signal])
+        return retval
+
+    def __decode(self, protocol, options):
+        options = dict(options)
+        signals = [self.waveforms[options.pop(signal)] for signal in PROTOCOLS[protocol]]
+        if protocol == 'i2c':
+            return [(x.timebase[0], x) for x in I2CAnalyzer(self.timebase, *signals, cache=self.cache, **options).transactions()]
+        elif protocol == 'spi':
+            return [(x.timebase[0], x) for x in SPIAnalyzer(self.timebase, *signals, cache=self.cache, **options).transactions()]
+        else:
+            return [(x.start, x) for x in UARTAnalyzer(self.timebase, *signals, cache=self.cache, **options).frames()]
+
+    def run(self, timebase=None, waveforms=None):
+        '''
+        Decode the capture, or the one provided.
+        '''
+        if timebase is not None:
+            self.load(timebase, waveforms)
+        events = []
+        for name, protocol, options in self.decoders:
+            events.extend((time, name, item) for time, item in self.__decode(protocol, options))
+        events.sort(key=lambda event: event[0])
+        return events
@@ -0,0 +1,142 @@
+from __future__ import with_statement
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+class ScreenshotArchive(object):
+    '''
+    A directory of screenshots, where each distinct screen image is only stored once.
+
+    Images are stored gzipped, named by the SHA1 hash of the TIFF data.  The index file records
+    the time at which the screen changed to each image.  If budget (in bytes) is set, the oldest
+    frames are evicted whenever the stored images would take up more than that.
+    '''
+    INDEX = "index.csv"
+
+    def __init__(self, path, budget=None):
+        self.path = path
+        self.budget = budget
+        self.frames = [] # (timestamp, hash) for every change of screen, oldest first
+        self.sizes = {}
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        index = os.path.join(path, ScreenshotArchive.INDEX)
+        if os.path.exists(index):
+            with open(index) as fp:
+                for line in fp:
+                    timestamp, hash = line.strip().split(',')
+                    self.frames.append((float(timestamp), hash))
+        for timestamp, hash in self.frames:
+            if hash not in self.sizes:
+                self.sizes[hash] = os.path.getsize(self.__filename(hash))
+
+    def __str__(self):
+        return "<ScreenshotArchive at %s: %d frames, %d images, %d bytes>" % (self.path, len(self.frames), len(self.sizes), self.size)
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __filename(self, hash):
+        return os.path.join(self.path, hash + ".tif.gz")
+
+    @property
+    def size(self):
+        return sum(self.sizes.values())
+
+    def add(self, tiff_data, timestamp=None):
+        '''
+        Add a screenshot to the archive.  Returns True if the screen has changed since the last one.
+        '''
+        timestamp = time.time() if timestamp == None else timestamp
+        hash = hashlib.sha1(tiff_data).hexdigest()
+        if self.frames and self.frames[-1][1] == hash:
+            return False
+        if hash not in self.sizes:
+            filename = self.__filename(hash)
+            fp = gzip.open(filename, 'wb')
+            try:
+                fp.write(tiff_data)
+            finally:
+                fp.close()
+            self.sizes[hash] = os.path.getsize(filename)
+        self.frames.append((timestamp, hash))
+        with open(os.path.join(self.path, ScreenshotArchive.INDEX), 'a') as fp:
+            fp.write("%f,%s\n" % (timestamp, hash))
+        if self.budget != None:
+            self.evict(self.budget)
+        return True
+
+    def evict(self, budget):
+        '''
+        Drop the oldest frames until the stored images take up no more than budget bytes.
+
+        The newest frame is always kept.
+        '''
+        if self.size <= budget:
+            return
+        frames = list(self.frames)
+        while len(frames) > 1 and self.size > budget:
+            timestamp, hash = frames.pop(0)
+            if hash not in [h for t, h in frames]:
+                os.remove(self.__filename(hash))
+                del self.sizes[hash]
+        self.frames = frames
+        with open(os.path.join(self.path, ScreenshotArchive.INDEX), 'w') as fp:
+            for timestamp, hash in frames:
+                fp.write("%f,%s\n" % (timestamp, hash))
+
+    def get(self, hash):
+        '''
+        Return the TIFF data for the image with the provided hash.
+        '''
+        fp = gzip.open(self.__filename(hash), 'rb')
+        try:
+            return fp.read()
+        finally:
+            fp.close()
+
+    def at(self, timestamp):
+        '''
+        Return the TIFF data for what was on screen at the provided time.
+        '''
+        for t, hash in reversed(self.frames):
+            if t <= timestamp:
+                return self.get(hash)
+        raise KeyError("No screenshot at or before %s" % time.ctime(timestamp))
+
+class ScreenshotRecorder(threading.Thread):
+    '''
+    Background thread that takes a screenshot every interval seconds and stores it in a ScreenshotArchive.
+
+    The scope can still be used from other threads while recording: access to its port is
+    serialized, so a command just waits while a screenshot is being read.
+    '''
+    def __init__(self, scope, archive, interval=5.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.scope = scope
+        self.archive = archive
+        self.interval = interval
+        self.errors = []
+        self.captured = 0
+        self.__stop = threading.Event()
+
+    def run(self):
+        while not self.__stop.is_set():
+            start = time.time()
+            try:
+                self.archive.add(self.scope.get_screenshot(), timestamp=start)
+                self.captured += 1
+            except Exception, e:
+                self.errors.append((start, e))
+            self.__stop.wait(max(0, self.interval - (time.time() - start)))
+
+    def stop(self, wait=True):
+        self.__stop.set()
+        if wait:
+            self.join()
@@ -0,0 +1,144 @@
+from __future__ import with_statement
+import os
+import sqlite3
+from processing import I2CTransaction, SPITransaction, UARTFrame, BusWord
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transactions (
+    capture REAL,       -- Timestamp of the capture (see CaptureArchive)
+    offset REAL,        -- Time of the transaction within the capture
+    time REAL,          -- capture + offset
+    decoder TEXT,
+    protocol TEXT,
+    address INTEGER,
+    direction TEXT,
+    payload TEXT,       -- Hex, two digits per byte
+    inbound TEXT
+);
+CREATE INDEX IF NOT EXISTS by_address ON transactions (protocol, address, direction, payload);
+CREATE INDEX IF NOT EXISTS by_payload ON transactions (payload);
+CREATE INDEX IF NOT EXISTS by_time ON transactions (time);
+CREATE INDEX IF NOT EXISTS by_capture ON transactions (capture);
+'''
+
+def _hex(data, digits=2):
+    return "".join("%0*X" % (digits, x) for x in data)
+
+def _unhex(data, digits=2):
+    return [int(data[i:i+digits], 16) for i in range(0, len(data), digits)] if data else []
+
+def describe(item):
+    '''
+    Return the protocol, address, direction, payload and inbound payload of a decoded transaction or frame.
+    '''
+    if isinstance(item, I2CTransaction):
+        return 'i2c', item.address, 'read' if item.readwrite else 'write', _hex(item.payload), None
+    elif isinstance(item, SPITransaction):
+        return 'spi', None, None, _hex(item.outbound), _hex(item.inbound)
+    elif isinstance(item, UARTFrame):
+        return 'uart', None, None, _hex([item.value]), None
+    elif isinstance(item, BusWord):
+        return 'bus', None, None, _hex([item.value], 4), None
+    raise ValueError("Don't know how to index %r" % item)
+
+class SearchHit(object):
+    def __init__(self, index, row):
+        self.index = index
+        self.capture_timestamp, self.offset, self.time, self.decoder, self.protocol, self.address, self.direction = row[:7]
+        digits = 4 if self.protocol == 'bus' else 2
+        self.payload = _unhex(row[7], digits)
+        self.inbound = _unhex(row[8], digits)
+
+    def __str__(self):
+        address = " addr=0x%02x" % self.address if self.address != None else ""
+        direction = " %s" % self.direction.upper() if self.direction else ""
+        return "<%s %s%s%s %s @ %+gs>" % (self.decoder, self.protocol.upper(), direction, address, _hex(self.payload), self.offset)
+
+    def __repr__(self):
+        return str(self)
+
+    def capture(self):
+        '''
+        Load the capture this transaction was decoded from
+        '''
+        return self.index.archive.get(self.capture_timestamp)
+
+class TransactionIndex(object):
+    '''
+    A searchable index of decoded transactions, stored in an SQLite database next to a CaptureArchive.
+
+    Transactions are indexed once, when they are decoded, by protocol, address, direction,
+    payload and time, so searches don't need to decode the captures again.
+    '''
+    FILENAME = "transactions.sqlite"
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.db = sqlite3.connect(os.path.join(archive.path, TransactionIndex.FILENAME))
+        self.db.executescript(SCHEMA)
+
+    def __str__(self):
+        return "<TransactionIndex of %d transactions in %s>" % (len(self), self.archive.path)
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+    def add(self, capture, events, save=True):
+        '''
+        Index the decoded events from a capture: (time, decoder name, transaction or frame), as
+        returned by DecodePipeline.run() or Scope.decode().  If save is set, the capture is also
+        stored in the archive.
+        '''
+        if save:
+            self.archive.add(capture)
+        rows = []
+        for offset, decoder, item in events:
+            rows.append((capture.timestamp, offset, capture.timestamp + offset, decoder) + describe(item))
+        with self.db:
+            self.db.executemany("INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def remove(self, capture_timestamp):
+        '''
+        Drop the transactions for a capture from the index
+        '''
+        with self.db:
+            self.db.execute("DELETE FROM transactions WHERE capture = ?", (capture_timestamp,))
+
+    def search(self, protocol=None, address=None, direction=None, prefix=None, decoder=None, start=None, end=None, limit=None):
+        '''
+        Find transactions, oldest first.  Every criterion that is set must match.
+
+        prefix is the start of the payload, as a list of bytes (or words for 'bus') or a hex
+        string.  start and end limit the (absolute) time of the transactions.
+        '''
+        clauses, values = [], []
+        for column, value in (('protocol', protocol), ('address', address), ('direction', direction), ('decoder', decoder)):
+            if value != None:
+                clauses.append("%s = ?" % column)
+                values.append(value.lower() if column in ('protocol', 'direction') else value)
+        if prefix != None:
+            if not isinstance(prefix, str):
+                prefix = _hex(prefix, 4 if protocol == 'bus' else 2)
+            # A range rather than LIKE, so that the index is used
+            clauses.append("payload >= ? AND payload < ?")
+            values += [prefix.upper(), prefix.upper() + "G"]
+        if start != None:
+            clauses.append("time >= ?")
+            values.append(start)
+        if end != None:
+            clauses.append("time <= ?")
+            values.append(end)
+        query = "SELECT * FROM transactions"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY time"
+        if limit != None:
+            query += " LIMIT %d" % limit
+        return [SearchHit(self, row) for row in self.db.execute(query, values)]
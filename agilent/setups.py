@@ -0,0 +1,146 @@
+from __future__ import with_statement
+import json
+import os
+from common import StateMirror, QUERY_ASCII, QUERY_NONE
+
+def same_value(a, b):
+    '''
+    Compare two setting values, numerically if they are both numbers.
+    '''
+    try:
+        a, b = float(a), float(b)
+    except ValueError:
+        return a.strip().upper() == b.strip().upper()
+    return abs(a-b) <= 1e-6*max(abs(a), abs(b))
+
+class Setup(object):
+    '''
+    A decoded set of instrument settings (SCPI header -> value) that can be diffed against another.
+    '''
+    def __init__(self, settings=None):
+        self.settings = {}
+        for header, value in (settings or {}).items():
+            self.settings[StateMirror.header(str(header))] = str(value)
+
+    def __str__(self):
+        return "<Setup of %d settings>" % len(self.settings)
+
+    def __repr__(self):
+        return str(self)
+
+    def __getitem__(self, header):
+        return self.settings[StateMirror.header(header)]
+
+    @classmethod
+    def read(cls, instrument):
+        '''
+        Read the current setup from the instrument.  Settings held by the instrument's state mirror
+        are not re-read.  Everything else is read in one batch.
+        '''
+        settings = {}
+        missing = []
+        for header in instrument.MIRRORED_QUERIES:
+            value = instrument.mirror.read(header) if instrument.mirror != None else None
+            if value == None:
+                missing.append(header)
+            else:
+                settings[header] = value
+        if missing:
+            settings.update(zip(missing, instrument.commands([(header + "?", QUERY_ASCII) for header in missing])))
+        return cls(settings)
+
+    def diff(self, current, order=()):
+        '''
+        Return the commands needed to change current to this setup.
+
+        Commands are generated in the order of the headers in order, then any others.
+        '''
+        order = [StateMirror.header(header) for header in order]
+        headers = [header for header in order if header in self.settings]
+        headers += sorted(header for header in self.settings if header not in order)
+        commands = []
+        for header in headers:
+            value = self.settings[header]
+            if header not in current.settings or not same_value(value, current.settings[header]):
+                commands.append(":%s %s" % (header, value))
+        return commands
+
+    def apply(self, instrument, current=None):
+        '''
+        Send the commands needed to put the instrument into this setup.  Returns the commands sent.
+        '''
+        if current == None:
+            current = Setup.read(instrument)
+        commands = self.diff(current, order=instrument.MIRRORED_QUERIES)
+        if commands:
+            instrument.commands([(command, QUERY_NONE) for command in commands])
+        return commands
+
+    def save(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump(self.settings, fp, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as fp:
+            return cls(json.load(fp))
+
+class SetupLibrary(object):
+    '''
+    Named setups for an instrument, cached in memory and, if path is set, stored in that directory.
+    '''
+    def __init__(self, instrument, path=None):
+        self.instrument = instrument
+        self.path = path
+        self.setups = {}
+
+    def __str__(self):
+        return "<SetupLibrary of %s>" % ", ".join(self.names())
+
+    def __repr__(self):
+        return str(self)
+
+    def __filename(self, name):
+        return os.path.join(self.path, "%s.json" % name)
+
+    def names(self):
+        names = set(self.setups)
+        if self.path and os.path.isdir(self.path):
+            names.update(os.path.splitext(f)[0] for f in os.listdir(self.path) if f.endswith(".json"))
+        return sorted(names)
+
+    def __contains__(self, name):
+        return name in self.names()
+
+    def __getitem__(self, name):
+        if name not in self.setups:
+            if not self.path or not os.path.exists(self.__filename(name)):
+                raise KeyError("No setup named %s" % name)
+            self.setups[name] = Setup.load(self.__filename(name))
+        return self.setups[name]
+
+    def __setitem__(self, name, setup):
+        self.setups[name] = setup
+        if self.path:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            setup.save(self.__filename(name))
+
+    def __delitem__(self, name):
+        self.setups.pop(name, None)
+        if self.path and os.path.exists(self.__filename(name)):
+            os.remove(self.__filename(name))
+
+    def save(self, name):
+        '''
+        Read the instrument's current setup and store it under name.
+        '''
+        setup = Setup.read(self.instrument)
+        self[name] = setup
+        return setup
+
+    def recall(self, name):
+        '''
+        Put the instrument into the named setup, sending only the settings that differ.  Returns the commands sent.
+        '''
+        return self[name].apply(self.instrument)
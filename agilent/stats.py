@@ -0,0 +1,261 @@
+from __future__ import with_statement
+import bisect
+import json
+import threading
+import time
+
+def _steps(low, high, steps=(1, 2, 5)):
+    # 1-2-5 series of bucket bounds from low to high
+    bounds = []
+    decade = low
+    while decade <= high:
+        bounds.extend(decade*step for step in steps)
+        decade *= 10
+    return [bound for bound in bounds if bound <= high]
+
+TIME_BOUNDS = _steps(1e-5, 100.0)
+COUNT_BOUNDS = _steps(1, 10**8)
+
+class Histogram(object):
+    '''
+    Counts of values in buckets with fixed upper bounds, plus running totals.
+    '''
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds)+1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __str__(self):
+        return "<Histogram of %d values, mean %g>" % (self.count, self.mean)
+
+    def __repr__(self):
+        return str(self)
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min == None else min(self.min, value)
+        self.max = value if self.max == None else max(self.max, value)
+
+    @property
+    def mean(self):
+        return float(self.total)/self.count if self.count else 0.0
+
+    def percentile(self, p):
+        '''
+        Upper bound of the bucket holding the p'th percentile (0-100)
+        '''
+        if not self.count:
+            return None
+        target = self.count*p/100.0
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self):
+        '''
+        Return (upper bound, count) for each non-empty bucket.  The last bucket's bound is None.
+        '''
+        return [(bound, count) for bound, count in zip(self.bounds + [None], self.counts) if count]
+
+    def summary(self):
+        return {'count' : self.count, 'total' : self.total, 'mean' : self.mean, 'min' : self.min, 'max' : self.max,
+                'p50' : self.percentile(50), 'p90' : self.percentile(90), 'p99' : self.percentile(99)}
+
+class InstrumentStats(object):
+    '''
+    Latency and traffic histograms for an instrument's serial port.
+
+    Every command written to the port is timed from when it is written until the next command
+    is written or the port is closed, and its bytes out and in are counted.  These are recorded
+    under 'command:<header>', eg: 'command:WAV:DATA?' and 'command:WAV:DATA?.bytes_in'.
+
+    High-level calls (Instrument.commands(), errors() etc.) are recorded under their names, with
+    the number of round trips (queries waited on) they made, the time spent on the port and the
+    overhead: the time spent in Python rather than waiting on the port.  'open' and 'close' time
+    opening and closing the port.
+
+    If trace is set (a file-like object), a tab separated line of time, call, command, seconds,
+    bytes out and bytes in is written to it for every command and call.
+
+    Calls are tracked separately for each thread, so an instrument can be shared between threads.
+    '''
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.current = None # [header, start, bytes out, bytes in, waited]
+
+    @property
+    def calls(self):
+        # This thread's stack of [name, start, io time, round trips, bytes out, bytes in]
+        return self.local.__dict__.setdefault('calls', [])
+
+    def __str__(self):
+        return "<InstrumentStats of %d commands>" % sum(h.count for name, h in self.histograms.items() if name.startswith("command:") and '.' not in name)
+
+    def __repr__(self):
+        return str(self)
+
+    def __getitem__(self, name):
+        return self.histograms[name]
+
+    def add(self, name, value, bounds=TIME_BOUNDS):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(bounds)
+            self.histograms[name].add(value)
+
+    def __trace(self, command, seconds, bytes_out, bytes_in):
+        if self.trace != None:
+            call = self.calls[-1][0] if self.calls else ""
+            self.trace.write("%f\t%s\t%s\t%g\t%d\t%d\n" % (time.time(), call, command, seconds, bytes_out, bytes_in))
+
+    def begin_call(self, name):
+        self.calls.append([name, time.time(), 0.0, 0, 0, 0])
+
+    def end_call(self):
+        self.end_command()
+        name, start, io, round_trips, bytes_out, bytes_in = self.calls[-1]
+        elapsed = time.time() - start
+        self.add(name, elapsed)
+        self.add(name + ".io", io)
+        self.add(name + ".overhead", max(0.0, elapsed - io))
+        self.add(name + ".round_trips", round_trips, COUNT_BOUNDS)
+        self.__trace("", elapsed, bytes_out, bytes_in)
+        self.calls.pop()
+
+    def begin_command(self, command):
+        self.end_command()
+        header = command.strip().split(None, 1)[0].lstrip(':').upper() if command.strip() else ""
+        self.current = [header, time.time(), 0, 0, False]
+
+    def end_command(self):
+        if self.current == None:
+            return
+        header, start, bytes_out, bytes_in, waited = self.current
+        self.current = None
+        elapsed = time.time() - start
+        self.add("command:" + header, elapsed)
+        self.add("command:%s.bytes_out" % header, bytes_out, COUNT_BOUNDS)
+        self.add("command:%s.bytes_in" % header, bytes_in, COUNT_BOUNDS)
+        self.__trace(header, elapsed, bytes_out, bytes_in)
+
+    def io(self, seconds, bytes_out=0, bytes_in=0):
+        '''
+        Record time spent reading or writing the port.
+        '''
+        round_trip = 0
+        if self.current != None:
+            self.current[2] += bytes_out
+            self.current[3] += bytes_in
+            if bytes_in and not self.current[4]:
+                self.current[4] = True
+                round_trip = 1
+        for call in self.calls:
+            call[2] += seconds
+            call[3] += round_trip
+            call[4] += bytes_out
+            call[5] += bytes_in
+
+    def reset(self):
+        self.histograms.clear()
+
+    def summary(self):
+        '''
+        Return a dictionary of histogram name -> count, total, mean, min, max and percentiles.
+        '''
+        return dict((name, histogram.summary()) for name, histogram in self.histograms.items())
+
+    def report(self):
+        '''
+        Return a table of the timing histograms, biggest total first.
+        '''
+        lines = ["%-32s %8s %10s %10s %10s %10s" % ("", "count", "total", "mean", "p90", "max")]
+        timings = [(name, h) for name, h in self.histograms.items() if not name.endswith(("bytes_in", "bytes_out", "round_trips"))]
+        for name, h in sorted(timings, key=lambda x: -x[1].total):
+            lines.append("%-32s %8d %10.4f %10.6f %10.6f %10.6f" % (name, h.count, h.total, h.mean, h.percentile(90), h.max))
+        return "\n".join(lines)
+
+    def export(self, filename):
+        '''
+        Save the histograms, with their buckets, as JSON.
+        '''
+        data = {}
+        for name, histogram in self.histograms.items():
+            data[name] = histogram.summary()
+            data[name]['buckets'] = histogram.buckets()
+        with open(filename, 'w') as fp:
+            json.dump(data, fp, indent=1, sort_keys=True)
+
+class MeteredPort(object):
+    '''
+    Wraps a serial port, timing reads and writes and counting bytes for an InstrumentStats.
+    '''
+    def __init__(self, port, stats):
+        self.__dict__['port'] = port
+        self.__dict__['stats'] = stats
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.port, name, value)
+
+    def open(self):
+        start = time.time()
+        self.port.open()
+        self.stats.add("open", time.time() - start)
+
+    def close(self):
+        self.stats.end_command()
+        start = time.time()
+        self.port.close()
+        self.stats.add("close", time.time() - start)
+
+    def write(self, data):
+        if data.strip():
+            self.stats.begin_command(data)
+        start = time.time()
+        retval = self.port.write(data)
+        self.stats.io(time.time() - start, bytes_out=len(data))
+        return retval
+
+    def read(self, *args):
+        start = time.time()
+        data = self.port.read(*args)
+        self.stats.io(time.time() - start, bytes_in=len(data))
+        return data
+
+    def readline(self, *args):
+        start = time.time()
+        data = self.port.readline(*args)
+        self.stats.io(time.time() - start, bytes_in=len(data))
+        return data
+
+def metered(name):
+    '''
+    Decorator for Instrument methods, recording each call under name when the instrument's stats are enabled.
+    '''
+    def decorate(f):
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats == None:
+                return f(self, *args, **kwargs)
+            stats.begin_call(name)
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                stats.end_call()
+        wrapper.__name__ = f.__name__
+        wrapper.__doc__ = f.__doc__
+        return wrapper
+    return decorate
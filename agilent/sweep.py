@@ -0,0 +1,115 @@
+import threading
+import time
+from capture import Capture
+from agilent_54622d import Measurements
+
+def logspace(start, stop, count):
+    '''
+    count values from start to stop, evenly spaced on a log scale (eg: frequencies for a Bode plot)
+    '''
+    if count < 2:
+        return [float(start)]
+    ratio = (float(stop)/start)**(1.0/(count-1))
+    return [start*ratio**i for i in range(count)]
+
+class Sweep(object):
+    '''
+    Steps a function generator through a series of settings, measuring with a scope at each one.
+
+    At each point the generator is programmed with a single APPL command, left to settle, and
+    the scope takes a single acquisition.  While the scope's measurements (and waveforms, if
+    any are asked for) are being read out, the generator is already being programmed for the
+    next point, since the scope is stopped and holds on to the acquired data.
+
+    The generator's error queue is drained before the sweep and only checked at the end of it,
+    so an error at any point of the sweep is reported then.  Measurements can be given by name
+    or :MEAS mnemonic (eg: 'frequency' or 'FREQ'), and columns are named as they were given.
+    '''
+    def __init__(self, generator, scope, channels=("CHAN1",), measurements=("amplitude",), waveforms=None,
+                 type="SIN", amp=None, offset=None, settle=0.0, timeout=None, points=1000):
+        self.generator = generator
+        self.scope = scope
+        self.channels = [scope[channel].name for channel in channels]
+        self.measurements = measurements
+        self.names = [Measurements.name(item) for item in measurements]
+        self.waveforms = waveforms
+        self.type = type
+        self.amp = amp
+        self.offset = offset
+        self.settle = settle
+        self.timeout = timeout
+        self.points = points
+
+    def __settings(self, point):
+        # A point is either a frequency, or a dictionary of APPL settings
+        settings = {'type' : self.type, 'freq' : None, 'amp' : self.amp, 'offset' : self.offset}
+        if isinstance(point, dict):
+            settings.update(point)
+        else:
+            settings['freq'] = point
+        return settings
+
+    def __program(self, settings):
+        self.generator.apply(settings['type'], settings['freq'], settings['amp'], settings['offset'], check=False)
+        if self.settle:
+            time.sleep(self.settle)
+
+    def __readout(self, row):
+        results = self.scope.measure_all(self.names, channels=self.channels)
+        for channel in self.channels:
+            for item, name in zip(self.measurements, self.names):
+                row["%s.%s" % (channel, item)] = results[channel][name]
+        if self.waveforms:
+            t, data = self.scope.acquire(self.waveforms, points=self.points)
+            row['capture'] = Capture(t, data)
+
+    def run(self, points):
+        '''
+        Run the sweep over points (a list or generator of frequencies, or dictionaries of
+        'type', 'freq', 'amp' and 'offset').  Returns a dictionary of column name -> list of
+        values, with a column for each setting and one for each channel and measurement,
+        named like 'CHAN1.amplitude'.
+        '''
+        rows = []
+        readout = None
+        points = iter(points)
+        try:
+            settings = self.__settings(points.next())
+        except StopIteration:
+            return {}
+        self.generator.errors()
+        self.__program(settings)
+        while settings != None:
+            self.scope.single(wait=True, timeout=self.timeout)
+            row = dict(settings)
+            rows.append(row)
+
+            errors = []
+            def read(row=row):
+                try:
+                    self.__readout(row)
+                except Exception, e:
+                    errors.append(e)
+            readout = threading.Thread(target=read)
+            readout.start()
+
+            # Set up the next point while this one is read out
+            try:
+                settings = self.__settings(points.next())
+                self.__program(settings)
+            except StopIteration:
+                settings = None
+            finally:
+                readout.join()
+            if errors:
+                raise errors[0]
+
+        self.generator.errors(True)
+        columns = {}
+        for row in rows:
+            for key in row:
+                columns.setdefault(key, [])
+        for row in rows:
+            for key in columns:
+                columns[key].append(row.get(key))
+        return columns
@@ -0,0 +1,210 @@
+'''
+Synthetic I2C, SPI and UART waveforms, for exercising the protocol analyzers without a scope.
+
+The generators return a timebase and a list of samples for each signal, in the order the
+analyzers take them, eg: I2CAnalyzer(*i2c([(0x50, WRITE, [0x12, 0x34])])).
+
+Signals are built as lists of edges, optionally jittered, then sampled at sample_rate with
+optional linear rise/fall times and gaussian noise.
+'''
+import random
+
+WRITE = 0
+READ = 1
+
+class Signal(object):
+    '''
+    A logic signal as a list of (time, level) edges, starting at level at time 0.
+    '''
+    def __init__(self, level):
+        self.edges = [(0.0, level)]
+
+    @property
+    def level(self):
+        return self.edges[-1][1]
+
+    def set(self, time, level):
+        if level != self.level:
+            self.edges.append((time, level))
+
+    def jitter(self, sigma, rng):
+        '''
+        Move every edge by a random amount (gaussian, sigma seconds), keeping them in order.
+        '''
+        edges = [self.edges[0]]
+        for time, level in self.edges[1:]:
+            edges.append((max(edges[-1][0], time + rng.gauss(0, sigma)), level))
+        self.edges = edges
+
+    def sample(self, timebase, high=3.3, low=0.0, rise_time=0.0, noise=0.0, rng=None):
+        retval = []
+        edges = self.edges
+        i = 0
+        previous = current = high if edges[0][1] else low
+        for t in timebase:
+            while i+1 < len(edges) and edges[i+1][0] <= t:
+                i += 1
+                previous = current
+                current = high if edges[i][1] else low
+            value = current
+            if rise_time and i > 0 and t - edges[i][0] < rise_time:
+                value = previous + (current - previous)*(t - edges[i][0])/rise_time
+            if noise:
+                value += rng.gauss(0, noise)
+            retval.append(value)
+        return retval
+
+def _timebase(end, sample_rate, samples):
+    if samples == None:
+        samples = int(end*sample_rate) + 1
+    return [i/float(sample_rate) for i in range(samples)]
+
+def _render(signals, end, sample_rate, samples, noise, jitter, rise_time, high, low, seed):
+    rng = random.Random(seed)
+    if jitter:
+        for signal in signals:
+            signal.jitter(jitter, rng)
+    t = _timebase(end, sample_rate, samples)
+    return [t] + [signal.sample(t, high, low, rise_time, noise, rng) for signal in signals]
+
+def _bits(word, bits, lsb_first=False):
+    retval = [(word >> (bits-1-i)) & 1 for i in range(bits)]
+    return retval[::-1] if lsb_first else retval
+
+def i2c(transactions, sample_rate=10e6, clock=100e3, samples=None, gap=None, stretch=0.0,
+        noise=0.0, jitter=0.0, rise_time=0.0, high=3.3, low=0.0, seed=None):
+    '''
+    Synthesize I2C transactions.  Returns t, sda, scl.
+
+    Each transaction is a (address, READ or WRITE, data) message, or a list of messages, which
+    are sent separated by repeated starts.  A message can have a fourth item: a list of ACKs
+    (True) and NACKs (False) for the address byte and each data byte.  By default every byte is
+    ACKed, except the last byte of a read, which the master NACKs.
+
+    gap is the idle time between transactions (default two clock periods), and stretch is how
+    long the slave holds SCL low after each byte (clock stretching).  samples, if set, fixes the
+    length of the capture, which is otherwise just long enough to hold all of the transactions.
+    '''
+    period = 1.0/clock
+    gap = 2*period if gap == None else gap
+    sda, scl = Signal(1), Signal(1)
+    t = gap
+    for transaction in transactions:
+        if isinstance(transaction, tuple):
+            transaction = [transaction]
+        for n, message in enumerate(transaction):
+            address, readwrite, data = message[:3]
+            if len(message) > 3:
+                acks = message[3]
+            else:
+                acks = [True]*(len(data)+1)
+                if readwrite == READ and data:
+                    acks[-1] = False
+            if n > 0:
+                # Repeated start: release SDA while SCL is low, then start again
+                scl.set(t, 0)
+                sda.set(t + period/4, 1)
+                scl.set(t + period/2, 1)
+                t += 3*period/4
+            # Start: SDA falls while SCL is high
+            sda.set(t, 0)
+            t += period/2
+            for byte, ack in zip([(address << 1) | readwrite] + list(data), acks):
+                for bit in _bits(byte, 8) + [0 if ack else 1]:
+                    scl.set(t, 0)
+                    sda.set(t + period/4, bit)
+                    t += period/2
+                    scl.set(t, 1)
+                    t += period/2
+                t += stretch
+                # The slave holds SCL low while it stretches the clock
+                if stretch:
+                    scl.set(t - stretch, 0)
+        # Stop: SDA rises while SCL is high
+        scl.set(t, 0)
+        sda.set(t + period/4, 0)
+        scl.set(t + period/2, 1)
+        sda.set(t + 3*period/4, 1)
+        t += 3*period/4 + gap
+    return tuple(_render([sda, scl], t, sample_rate, samples, noise, jitter, rise_time, high, low, seed))
+
+def spi(transfers, mode=0, bits=8, sample_rate=10e6, clock=1e6, samples=None, gap=None, lead=None, lag=None,
+        lsb_first=False, noise=0.0, jitter=0.0, rise_time=0.0, high=3.3, low=0.0, seed=None):
+    '''
+    Synthesize SPI transfers.  Returns t, miso, mosi, sck, cs.
+
+    Each transfer is a (mosi words, miso words) pair, sent in a single CS low period.  mode is the
+    SPI mode (0-3: CPOL in bit 1, CPHA in bit 0) and bits is the word size.  gap is the idle time
+    between transfers, and lead and lag the time from CS falling to the first clock edge and
+    from the last clock edge to CS rising.  All default to half a clock period or more.
+    '''
+    period = 1.0/clock
+    gap = 2*period if gap == None else gap
+    lead = period/2 if lead == None else lead
+    lag = period/2 if lag == None else lag
+    cpol, cpha = (mode >> 1) & 1, mode & 1
+    miso, mosi, sck, cs = Signal(0), Signal(0), Signal(cpol), Signal(1)
+    t = gap
+    for outbound, inbound in transfers:
+        if len(outbound) != len(inbound):
+            raise ValueError("Outbound and inbound transfers must be the same length.")
+        cs.set(t, 0)
+        t += lead
+        if cpha == 0:
+            t -= period/2
+        out_bits = sum([_bits(word, bits, lsb_first) for word in outbound], [])
+        in_bits = sum([_bits(word, bits, lsb_first) for word in inbound], [])
+        for o, i in zip(out_bits, in_bits):
+            if cpha == 0:
+                # Data is set up half a period before the leading edge, and sampled on it
+                mosi.set(t, o)
+                miso.set(t, i)
+                t += period/2
+                sck.set(t, 1 - cpol)
+                t += period/2
+                sck.set(t, cpol)
+            else:
+                # Data changes on the leading edge, and is sampled on the trailing edge
+                sck.set(t, 1 - cpol)
+                mosi.set(t, o)
+                miso.set(t, i)
+                t += period/2
+                sck.set(t, cpol)
+                t += period/2
+        if cpha == 1:
+            t -= period/2
+        t += lag
+        cs.set(t, 1)
+        mosi.set(t, 0)
+        miso.set(t, 0)
+        t += gap
+    return tuple(_render([miso, mosi, sck, cs], t, sample_rate, samples, noise, jitter, rise_time, high, low, seed))
+
+def uart(data, baud=9600, bits=8, parity=None, stop_bits=1, inverted=False, sample_rate=None, samples=None,
+         gap=None, noise=0.0, jitter=0.0, rise_time=0.0, high=3.3, low=0.0, seed=None):
+    '''
+    Synthesize an asynchronous serial line sending data (a string or a list of words).  Returns t, rx.
+
+    parity is None, 'even', 'odd', 'mark' or 'space'.  sample_rate defaults to 16 samples per
+    bit, and gap (the idle time between words) to none.
+    '''
+    bit_time = 1.0/baud
+    sample_rate = 16*baud if sample_rate == None else sample_rate
+    gap = 0.0 if gap == None else gap
+    idle = 0 if inverted else 1
+    rx = Signal(idle)
+    t = 2*bit_time
+    for word in data:
+        if isinstance(word, str):
+            word = ord(word)
+        frame = [0] + _bits(word, bits, lsb_first=True)
+        if parity != None:
+            ones = sum(frame)
+            frame.append({'even' : ones % 2, 'odd' : 1 - ones % 2, 'mark' : 1, 'space' : 0}[parity])
+        frame += [1]*stop_bits
+        for bit in frame:
+            rx.set(t, 1 - bit if inverted else bit)
+            t += bit_time
+        t += gap
+    t += 2*bit_time
+    return tuple(_render([rx], t, sample_rate, samples, noise, jitter, rise_time, high, low, seed))
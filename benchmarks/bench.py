@@ -0,0 +1,222 @@
+'''
+Benchmarks for the acquisition, decode and transport hot paths.
+
+Each case is run on synthetic data at each of the requested sizes (in samples), and the best of
+a few runs is reported.  Results can be saved as a baseline and later runs compared against it:
+
+    python benchmarks/bench.py --save          # record benchmarks/baseline.json
+    python benchmarks/bench.py --check         # compare, exit with 1 on a regression
+    python benchmarks/bench.py --sizes 100,10000,2000000 --cases pod_unpack,block_read
+
+Timings depend on the machine, so the baseline isn't checked in: record one locally before
+making a change, then check against it.
+
+The decoders are far from linear in the number of samples, so the default sizes stop at 10000.
+'''
+from __future__ import with_statement
+import json
+import optparse
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import serial
+from agilent.agilent_54622d import Pod, AnalogChannel, POD1, parse_preamble, scale_samples
+from agilent.common import read_block, QUERY_ASCII, QUERY_BINARY
+from agilent.processing import LogicAnalyzer, I2CAnalyzer, SPIAnalyzer, UARTAnalyzer, ParallelBusAnalyzer, EdgeCache
+from agilent import synth
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SIZES = (100, 1000, 10000)
+TOLERANCE = 1.25 # Slowdown, relative to the baseline, that counts as a regression
+
+PREAMBLE = "0,0,%d,1,1.0E-06,0.0E+00,0,4.0E-02,0.0E+00,128"
+
+CASES = []
+
+def case(f):
+    CASES.append((f.__name__, f))
+    return f
+
+def block(data):
+    size = str(len(data))
+    return "#%d%s%s" % (len(size), size, data)
+
+class CannedScope(object):
+    '''
+    Stands in for a Scope, answering every query in a batch with canned responses.
+    '''
+    def __init__(self, ascii, binary=None):
+        self.ascii = ascii
+        self.binary = binary
+
+    def commands(self, commands, check=True):
+        retval = []
+        for command, query in commands:
+            if query == QUERY_BINARY:
+                retval.append(self.binary)
+            elif query == QUERY_ASCII:
+                retval.append(self.ascii.get(command, "+0"))
+            else:
+                retval.append(None)
+        return retval
+
+def square_wave(size, period=20):
+    return [1 if (i // (period//2)) % 2 else 0 for i in range(size)]
+
+def i2c_capture(size):
+    '''
+    Four byte I2C writes, repeated to fill about size samples.  Returns t, sda, scl.
+    '''
+    transactions = max(1, size // 1500)
+    quarter = max(2, size // (160*transactions)) # Samples per quarter clock period
+    return synth.i2c([(0x50, synth.WRITE, [0x12, 0x34, i & 0xff]) for i in range(transactions)],
+                     sample_rate=4*quarter*100e3, clock=100e3)
+
+def spi_capture(size):
+    '''
+    Four byte mode 0 SPI transfers, repeated to fill about size samples.  Returns t, miso, mosi, sck, cs.
+    '''
+    transfers = max(1, size // 1500)
+    quarter = max(2, size // (150*transfers))
+    return synth.spi([([0x9f, 0x00, 0x55, i & 0xff], [0x00, 0xef, 0xaa, 0x42]) for i in range(transfers)],
+                     sample_rate=4*quarter*1e6, clock=1e6)
+
+@case
+def pod_unpack(size):
+    pod = Pod(CannedScope({}), POD1)
+    data = "".join(chr(i & 0xff) for i in range(size))
+    return lambda: pod.unpack(data)
+
+@case
+def analog_ascii(size):
+    values = ",".join("%+.6E" % (i*0.01) for i in range(size))
+    channel = AnalogChannel(CannedScope({":WAV:DATA?" : "#8%08d%s" % (len(values), values)}), "CHAN1")
+    return lambda: channel.get_rawdata()
+
+@case
+def analog_binary(size):
+    channel = AnalogChannel(CannedScope({":WAV:PRE?" : PREAMBLE % size}, "".join(chr(i & 0xff) for i in range(size))), "CHAN1")
+    def run():
+        preamble, data = channel.get_rawdata_binary()
+        return scale_samples(data, parse_preamble(preamble))
+    return run
+
+@case
+def edges(size):
+    analyzer = LogicAnalyzer(range(size))
+    analyzer['A'] = square_wave(size)
+    def run():
+        analyzer.cache = EdgeCache()
+        return analyzer.rising_edges('A'), analyzer.falling_edges('A'), analyzer.edges('A')
+    return run
+
+@case
+def index(size):
+    analyzer = LogicAnalyzer([i*1e-6 for i in range(size)])
+    times = [i*1e-6*size/100.0 + 0.3e-6 for i in range(100)]
+    return lambda: [analyzer.index(t) for t in times]
+
+@case
+def i2c_transactions(size):
+    t, sda, scl = i2c_capture(size)
+    return lambda: I2CAnalyzer(t, sda, scl).transactions()
+
+@case
+def spi_transactions(size):
+    t, miso, mosi, sck, cs = spi_capture(size)
+    return lambda: SPIAnalyzer(t, miso, mosi, sck, cs).transactions()
+
+@case
+def uart_frames(size):
+    t, rx = synth.uart("".join(chr(i & 0xff) for i in range(max(1, size // 160))), baud=115200)
+    return lambda: UARTAnalyzer(t, rx).frames()
+
+@case
+def parallel_bus(size):
+    # DIG15 clocks the bus every 4 samples
+    pod1 = "".join(chr(i & 0xff) for i in range(size))
+    pod2 = "".join(chr(((i >> 8) & 0x7f) | (0x80 if i & 2 else 0)) for i in range(size))
+    t = [i*1e-6 for i in range(size)]
+    return lambda: ParallelBusAnalyzer(t, pod1, pod2, clock=15).sample()
+
+@case
+def block_read(size):
+    # The loopback port only buffers a few kB, so the block is written from another thread
+    port = serial.serial_for_url("loop://", timeout=1)
+    data = block("\x55"*size) + "\n"
+    def run():
+        writer = threading.Thread(target=port.write, args=(data,))
+        writer.start()
+        retval = read_block(port)
+        port.read(1)
+        writer.join()
+        return retval
+    return run
+
+def measure(f, repeat=5, budget=2.0):
+    '''
+    Best time of up to repeat runs, stopping early once budget seconds have been spent.
+    '''
+    best = None
+    spent = 0
+    for i in range(repeat):
+        start = timeit.default_timer()
+        f()
+        elapsed = timeit.default_timer() - start
+        spent += elapsed
+        best = elapsed if best == None else min(best, elapsed)
+        if spent > budget:
+            break
+    return best
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--sizes", default=",".join(map(str, SIZES)), help="comma separated sample counts")
+    parser.add_option("--cases", default=None, help="comma separated cases to run (default: all)")
+    parser.add_option("--baseline", default=BASELINE)
+    parser.add_option("--save", action="store_true", help="save the results as the baseline")
+    parser.add_option("--check", action="store_true", help="exit with 1 if anything is slower than the baseline")
+    parser.add_option("--tolerance", type="float", default=TOLERANCE)
+    options, args = parser.parse_args()
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    names = options.cases.split(",") if options.cases else [name for name, f in CASES]
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as fp:
+            baseline = json.load(fp)
+
+    results = {}
+    regressions = []
+    print "%-20s %10s %12s %12s %10s" % ("case", "samples", "seconds", "ns/sample", "baseline")
+    for name, f in CASES:
+        if name not in names:
+            continue
+        for size in sizes:
+            key = "%s:%d" % (name, size)
+            seconds = measure(f(size))
+            results[key] = seconds
+            compare = ""
+            if key in baseline:
+                ratio = seconds/baseline[key]
+                compare = "%.2fx" % ratio
+                if ratio > options.tolerance:
+                    compare += " SLOWER"
+                    regressions.append(key)
+            print "%-20s %10d %12.6f %12.1f %10s" % (name, size, seconds, seconds/size*1e9, compare)
+            sys.stdout.flush()
+
+    if options.save:
+        baseline.update(results)
+        with open(options.baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=1, sort_keys=True)
+    if options.check and regressions:
+        print "Regressions: %s" % ", ".join(regressions)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
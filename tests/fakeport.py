@@ -0,0 +1,124 @@
+'''
+A fake serial port that answers SCPI commands, for testing the instrument drivers without hardware.
+'''
+import re
+import threading
+import time
+import serial
+
+def block(data):
+    '''
+    Format data as an IEEE 488.2 definite length block, with the newline the instruments send after it
+    '''
+    size = str(len(data))
+    return "#%d%s%s\n" % (len(size), size, data)
+
+class FakePort(object):
+    '''
+    Stands in for a serial.Serial.  Commands written to it are logged, and answered by the first
+    handler whose pattern matches: handlers is a dictionary of regular expression ->
+    function(port, command, match) returning the response (or None).  Other queries are answered
+    from state, which settings commands are recorded in.
+
+    Like a real port, it can't be opened twice or used while closed, and anything left unread
+    is discarded when it is closed.  If in_flight is set, unread data is kept instead, as if the
+    instrument were still sending it.  delay slows down every read, to widen race windows in
+    threaded tests.
+    '''
+    def __init__(self, handlers=None, delay=0.0, in_flight=False):
+        self.handlers = handlers or {}
+        self.delay = delay
+        self.in_flight = in_flight
+        self.state = {}
+        self.errors = [] # The instrument's error queue
+        self.log = []
+        self.out = ""
+        self.is_open = False
+        self.timeout = 1
+        self.lock = threading.Lock()
+
+    def __check(self):
+        if not self.is_open:
+            raise serial.SerialException("Attempting to use a port that is not open")
+
+    def open(self):
+        if self.is_open:
+            raise serial.SerialException("Port is already open.")
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+        if not self.in_flight:
+            with self.lock:
+                self.out = ""
+
+    def isOpen(self):
+        return self.is_open
+
+    def setRtsCts(self, value):
+        pass
+
+    def flush(self):
+        self.__check()
+
+    def flushInput(self):
+        self.__check()
+        with self.lock:
+            self.out = ""
+    reset_input_buffer = flushInput
+
+    def write(self, data):
+        self.__check()
+        for line in data.split("\n"):
+            line = line.strip()
+            if line:
+                self.log.append(line)
+                self.__handle(line)
+        return len(data)
+
+    def __handle(self, line):
+        for pattern, handler in self.handlers.items():
+            match = re.match(pattern, line)
+            if match:
+                response = handler(self, line, match)
+                if response != None:
+                    self.send(response)
+                return
+        if line.upper() in (":SYSTEM:ERR?", ":SYST:ERR?"):
+            self.send((self.errors.pop(0) if self.errors else '+0,"No error"') + "\n")
+        elif line.upper() == "*CLS":
+            self.errors = []
+        elif line.endswith("?"):
+            self.send(self.state.get(line[:-1].lstrip(":").upper(), "+0") + "\n")
+        elif " " in line:
+            header, value = line.split(" ", 1)
+            self.state[header.lstrip(":").upper()] = value
+
+    def send(self, data):
+        '''
+        Queue data for the host to read
+        '''
+        with self.lock:
+            self.out += data
+
+    def read(self, size=1):
+        self.__check()
+        time.sleep(self.delay)
+        with self.lock:
+            data, self.out = self.out[:size], self.out[size:]
+        return data
+
+    def readline(self):
+        self.__check()
+        time.sleep(self.delay)
+        with self.lock:
+            i = self.out.find("\n")
+            if i < 0:
+                data, self.out = self.out, ""
+            else:
+                data, self.out = self.out[:i+1], self.out[i+1:]
+        return data
+
+    @property
+    def in_waiting(self):
+        return len(self.out)
@@ -0,0 +1,39 @@
+import threading
+import unittest
+from fakeport import FakePort, block
+from agilent import Scope, OperationCancelled
+
+POINTS = 20000
+PREAMBLE = "0,0,%d,1,1.0E-06,0.0E+00,0,4.0E-02,0.0E+00,128\n" % POINTS
+
+class DeepAcquisitionTest(unittest.TestCase):
+    def setUp(self):
+        data = {'CHAN1' : "\x80"*POINTS, 'POD1' : "".join(chr(i & 0xff) for i in range(POINTS))}
+        self.scope = Scope(port="fake", connect=False)
+        # in_flight: the scope keeps sending the rest of a block after the port is closed
+        self.scope.port = FakePort({r":WAV:DATA\?" : lambda port, line, match: block(data[port.state["WAV:SOUR"]]),
+                                    r":WAV:PRE\?" : lambda port, line, match: PREAMBLE,
+                                    r":OPER:COND\?" : lambda port, line, match: "+8\n"}, in_flight=True)
+
+    def test_acquire(self):
+        progress = []
+        capture = self.scope.acquire_deep(["CHAN1", "DIG1"], callback=lambda count, total: progress.append(count))
+        self.assertEqual(progress[-1], 2*POINTS)
+        self.assertEqual(len(capture.timebase), POINTS)
+        self.assertEqual(set(capture["CHAN1"]), set([0.0]))
+        self.assertEqual(list(capture["DIG1"][:4]), [0, 0, 1, 1])
+
+    def test_port_usable_after_cancel(self):
+        cancel = threading.Event()
+        def progress(count, total):
+            cancel.set()
+        self.assertRaises(OperationCancelled, self.scope.acquire_deep, ["CHAN1", "DIG0"], callback=progress, cancel=cancel)
+        # Doesn't check the error queue first, so would read whatever was left of the block
+        self.assertTrue(self.scope.acquiring())
+        self.scope.command(":TIM:SCAL +1.0E-03")
+        self.assertEqual(self.scope.query(":TIM:SCAL?"), "+1.0E-03")
+        capture = self.scope.acquire_deep(["DIG0"])
+        self.assertEqual(list(capture["DIG0"][:4]), [0, 1, 0, 1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy
+from fakeport import FakePort, block
+from agilent import Scope
+from agilent.processing import ParallelBusAnalyzer
+
+VALUES = [0x12, 0x34, 0xa5, 0xff, 0x00]
+
+def bus(values, cs_inactive=()):
+    '''
+    Pod data for a bus with the values on DIG0-DIG7, clocked by DIG8 in the middle of each value,
+    and a chip select on DIG9 that is high for the values at the indexes in cs_inactive.
+    '''
+    pod1, pod2 = [], []
+    for i, value in enumerate(values):
+        for phase in range(4):
+            pod1.append(value)
+            control = 1 if phase >= 2 else 0
+            if i in cs_inactive:
+                control |= 2
+            pod2.append(control)
+    return "".join(map(chr, pod1)), "".join(map(chr, pod2))
+
+class ParallelBusAnalyzerTest(unittest.TestCase):
+    def test_rising_edges(self):
+        pod1, pod2 = bus(VALUES)
+        analyzer = ParallelBusAnalyzer(numpy.arange(len(pod1))*1e-6, pod1, pod2, clock="DIG8", data_bits=range(8))
+        self.assertEqual(analyzer.values(), VALUES)
+        self.assertEqual([word.time for word in analyzer.transfers()], [(4*i + 1)*1e-6 for i in range(len(VALUES))])
+
+    def test_falling_edges(self):
+        pod1, pod2 = bus(VALUES)
+        analyzer = ParallelBusAnalyzer(numpy.arange(len(pod1)), pod1, pod2, clock=8, edge="NEG", data_bits=range(8))
+        # The clock falls as each value ends
+        self.assertEqual(analyzer.values(), VALUES[:-1])
+
+    def test_chip_select(self):
+        pod1, pod2 = bus(VALUES, cs_inactive=(1, 3))
+        analyzer = ParallelBusAnalyzer(numpy.arange(len(pod1)), pod1, pod2, clock=8, cs="DIG9", data_bits=range(8))
+        self.assertEqual(analyzer.values(), [0x12, 0xa5, 0x00])
+
+    def test_scattered_bits(self):
+        pod1, pod2 = bus(VALUES)
+        analyzer = ParallelBusAnalyzer(numpy.arange(len(pod1)), pod1, pod2, clock=8, data_bits=["DIG7", "DIG0"])
+        self.assertEqual(analyzer.values(), [(value >> 7) | (value & 1) << 1 for value in VALUES])
+
+    def test_default_data_bits(self):
+        pod1, pod2 = bus(VALUES)
+        analyzer = ParallelBusAnalyzer(numpy.arange(len(pod1)), pod1, pod2, clock=8)
+        self.assertEqual(analyzer.data_bits, range(8) + range(9, 16))
+        self.assertEqual(analyzer.values(), VALUES)
+
+    def test_invalid_data_bits(self):
+        pod1, pod2 = bus(VALUES)
+        t = numpy.arange(len(pod1))
+        self.assertRaises(ValueError, ParallelBusAnalyzer, t, pod1, pod2, clock=8, data_bits=[])
+        self.assertRaises(ValueError, ParallelBusAnalyzer, t, pod1, pod2, clock=8, data_bits=[0, 16])
+        self.assertRaises(ValueError, ParallelBusAnalyzer, t, pod1, clock=0, data_bits=["DIG8"])
+
+class DecodeBusTest(unittest.TestCase):
+    def test_decode_bus(self):
+        pod1, pod2 = bus(VALUES)
+        data = {'POD1' : pod1, 'POD2' : pod2}
+        preamble = "0,0,%d,1,1.0E-06,0.0E+00,0,1.0E+00,0.0E+00,0\n" % len(pod1)
+        scope = Scope(port="fake", connect=False)
+        scope.port = FakePort({r":WAV:DATA\?" : lambda port, line, match: block(data[port.state["WAV:SOUR"]]),
+                               r":WAV:PRE\?" : lambda port, line, match: preamble})
+        words = scope.decode_bus("DIG8", data_bits=["DIG%d" % bit for bit in range(8)], points=None)
+        self.assertEqual([word.value for word in words], VALUES)
+        self.assertEqual([word.time for word in words], [(4*i + 1)*1e-6 for i in range(len(VALUES))])
+
+if __name__ == "__main__":
+    unittest.main()
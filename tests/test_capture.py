@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+import unittest
+import warnings
+import numpy
+from fakeport import FakePort, block
+from agilent import Capture, CaptureArchive, CaptureHistory, Scope
+
+def capture(points, keys=("A",), timestamp=0.0):
+    t = numpy.arange(points)*1e-6
+    return Capture(t, dict((key, numpy.ones(points)*timestamp) for key in keys), timestamp)
+
+class CaptureArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        archive = CaptureArchive(self.path)
+        for timestamp in (3.0, 1.0, 2.0):
+            archive.add(capture(10, ("A", "B"), timestamp))
+        self.assertEqual(len(archive), 3)
+        self.assertEqual(archive.timestamps(), [1.0, 2.0, 3.0])
+        loaded = archive.get(2.0)
+        self.assertEqual(sorted(loaded.keys()), ["A", "B"])
+        self.assertTrue(numpy.all(loaded["B"] == 2.0))
+        self.assertEqual([c.timestamp for c in archive.between(1.5, 3.0)], [2.0, 3.0])
+
+class CaptureHistoryTest(unittest.TestCase):
+    def test_ring(self):
+        history = CaptureHistory(frames=3)
+        for i in range(5):
+            history.append(capture(10, timestamp=i))
+        self.assertEqual(len(history), 3)
+        self.assertEqual([c.timestamp for c in history], [2.0, 3.0, 4.0])
+        self.assertEqual(history[-1]["A"][0], 4.0)
+
+    def test_shape_change_reallocates(self):
+        history = CaptureHistory(frames=3)
+        history.append(capture(10, timestamp=1))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            history.append(capture(20, ("A", "B"), timestamp=2))
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(len(history), 1)
+        self.assertEqual(sorted(history[0].keys()), ["A", "B"])
+        self.assertEqual(len(history[0].timebase), 20)
+
+    def test_max_bytes_reallocates_for_smaller_captures(self):
+        history = CaptureHistory(max_bytes=100000)
+        history.append(capture(1000))
+        frames = history.frames
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            history.append(capture(100))
+        self.assertTrue(history.frames > frames)
+
+class ScopeHistoryTest(unittest.TestCase):
+    def test_acquire_survives_history(self):
+        scope = Scope(port="fake", connect=False)
+        scope.port = FakePort({r":WAV:DATA\?" : lambda port, line, match: block(",".join(["+1.0E+00"]*int(port.state.get("WAV:POIN", 100))))})
+        scope.enable_history(frames=4)
+        scope.acquire(["CHAN1"], points=100)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            t, data = scope.acquire(["CHAN1", "CHAN2"], points=200)
+        self.assertEqual(len(data["CHAN2"]), 200)
+        self.assertEqual(len(scope.history), 1)
+
+if __name__ == "__main__":
+    unittest.main()
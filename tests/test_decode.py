@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import unittest
+import numpy
+from agilent import synth, Capture, CaptureArchive
+from agilent.processing import DecodePipeline
+
+class DecodePipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        t, sda, scl = synth.i2c([(0x50, synth.WRITE, [0x12, 0x34])], sample_rate=4e6, clock=100e3, samples=8000)
+        t, rx = synth.uart("ok", baud=115200, sample_rate=4e6, samples=8000, gap=5e-4)
+        self.capture = Capture(numpy.array(t), {'SDA' : numpy.array(sda), 'SCL' : numpy.array(scl), 'RX' : numpy.array(rx)})
+        self.pipeline = DecodePipeline()
+        self.pipeline.add('eeprom', 'i2c', sda='SDA', scl='SCL')
+        self.pipeline.add('console', 'uart', rx='RX', baud=115200)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def check(self, events):
+        transactions = [item for time, name, item in events if name == 'eeprom']
+        frames = [item.value for time, name, item in events if name == 'console']
+        self.assertEqual([(x.address, list(x.payload)) for x in transactions], [(0x50, [0x12, 0x34])])
+        self.assertEqual(frames, [ord('o'), ord('k')])
+        self.assertEqual([time for time, name, item in events], sorted(time for time, name, item in events))
+
+    def test_numpy_capture(self):
+        self.check(self.pipeline.run(*self.capture))
+
+    def test_archived_capture(self):
+        archive = CaptureArchive(self.path)
+        archive.add(self.capture)
+        self.check(self.pipeline.run(*archive.get(self.capture.timestamp)))
+
+    def test_rerun(self):
+        self.pipeline.load(*self.capture)
+        self.check(self.pipeline.run())
+        self.check(self.pipeline.run())
+
+class PipelineOptionsTest(unittest.TestCase):
+    def setUp(self):
+        t, miso, mosi, sck, cs = synth.spi([([0x9f, 0x00], [0xff, 0xc2])], mode=1, samples=400)
+        self.capture = (t, {'MISO' : miso, 'MOSI' : mosi, 'SCK' : sck, 'CS' : cs})
+        self.pipeline = DecodePipeline()
+
+    def test_spi_mode(self):
+        self.pipeline.add('flash', 'spi', miso='MISO', mosi='MOSI', sck='SCK', cs='CS', mode=1)
+        [(time, name, transaction)] = self.pipeline.run(*self.capture)
+        self.assertEqual(transaction.mode, 1)
+        self.assertEqual(list(transaction.outbound), [0x9f, 0x00])
+        self.assertEqual(list(transaction.inbound), [0xff, 0xc2])
+
+    def test_unknown_options(self):
+        self.assertRaises(TypeError, self.pipeline.add, 'flash', 'spi', miso='MISO', mosi='MOSI', sck='SCK', cs='CS', baud=9600)
+        self.assertRaises(TypeError, self.pipeline.add, 'eeprom', 'i2c', sda='SDA', scl='SCL', mode=0)
+        self.assertEqual(self.pipeline.decoders, [])
+
+if __name__ == "__main__":
+    unittest.main()
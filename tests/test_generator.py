@@ -0,0 +1,43 @@
+import sys
+import unittest
+from StringIO import StringIO
+from fakeport import FakePort
+from agilent import FunctionGenerator
+
+class UploadTest(unittest.TestCase):
+    def setUp(self):
+        self.generator = FunctionGenerator(port="fake", connect=False)
+        self.port = self.generator.port = FakePort()
+
+    def test_ascii_by_default(self):
+        self.generator.upload_waveform([0, 1, 0, -1]*4)
+        uploads = [line for line in self.port.log if line.startswith("DATA:DAC")]
+        self.assertEqual(uploads, ["DATA:DAC VOLATILE, 0,2047,0,-2047,0,2047,0,-2047,0,2047,0,-2047,0,2047,0,-2047"])
+
+    def test_binary_upload(self):
+        self.generator.upload_waveform([0, 1, 0, -1]*4, binary=True)
+        uploads = [line for line in self.port.log if line.startswith("DATA:DAC")]
+        self.assertEqual(len(uploads), 1)
+        self.assertTrue(uploads[0].startswith("DATA:DAC VOLATILE, #232"))
+
+    def test_verbose_summarizes_binary(self):
+        self.generator.verbose = True
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            self.generator.upload_waveform([0, 1, 0, -1]*4, binary=True)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue("--> 'DATA:DAC VOLATILE, #232...' <" in output, output)
+        self.assertFalse(any(ord(c) < 32 and c != "\n" for c in output))
+
+class WaveformLibraryTest(unittest.TestCase):
+    def test_only_generated_names_are_ours(self):
+        generator = FunctionGenerator(port="fake", connect=False)
+        generator.port = FakePort({r"DATA:NVOL:CAT\?" : lambda port, line, match: '"WAVE1","W0123ABC","WOBBLE","W89ABCDEF",""'})
+        generator.waveforms.refresh()
+        self.assertEqual(list(generator.waveforms.resident), ["W0123ABC"])
+        self.assertEqual(generator.waveforms.others, 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import numpy
+from agilent import measurements
+
+class MeasurementsTest(unittest.TestCase):
+    def square(self, low=0.0, high=2.0, period=100, cycles=10):
+        t = numpy.arange(period*cycles)*1e-6
+        y = numpy.where((numpy.arange(len(t)) // (period//2)) % 2, low, high)
+        return t, y
+
+    def test_top_base_of_ideal_square(self):
+        t, y = self.square()
+        top, base = measurements.top_base(y)
+        self.assertEqual(top, 2.0)
+        self.assertEqual(base, 0.0)
+
+    def test_ideal_square(self):
+        t, y = self.square(-1.0, 3.0)
+        result = measurements.measure(t, y)
+        self.assertEqual(result['top'], 3.0)
+        self.assertEqual(result['base'], -1.0)
+        self.assertEqual(result['amplitude'], 4.0)
+        self.assertEqual(result['overshoot'], 0.0)
+        self.assertEqual(result['undershoot'], 0.0)
+        self.assertAlmostEqual(result['period'], 100e-6)
+        self.assertAlmostEqual(result['duty_cycle'], 50.0)
+
+    def test_top_base_with_overshoot(self):
+        t, y = self.square()
+        y[::50] = 2.4
+        top, base = measurements.top_base(y)
+        self.assertEqual(top, 2.0)
+        self.assertEqual(base, 0.0)
+        self.assertAlmostEqual(measurements.measure(t, y, ['overshoot'])['overshoot'], 20.0)
+
+    def test_flat_waveforms(self):
+        top, base = measurements.top_base([[1.5]*10, [0.0]*10])
+        self.assertEqual(list(top), [1.5, 0.0])
+        self.assertEqual(list(base), [1.5, 0.0])
+
+    def sine(self, phase=0.0, freq=5e3, cycles=10, points=2000):
+        t = numpy.arange(points)*cycles/(freq*points)
+        return t, numpy.sin(2*numpy.pi*freq*t + numpy.radians(phase))
+
+    def test_phase_in_phase(self):
+        t, a = self.sine()
+        self.assertAlmostEqual(measurements.phase(t, a, a), 0.0)
+
+    def test_phase_slightly_leading(self):
+        t, a = self.sine()
+        t, b = self.sine(0.6)
+        self.assertAlmostEqual(measurements.phase(t, a, b), -0.6, places=1)
+        self.assertAlmostEqual(measurements.phase(t, b, a), 0.6, places=1)
+
+    def test_phase_lagging(self):
+        t, a = self.sine()
+        t, b = self.sine(-90.0)
+        self.assertAlmostEqual(measurements.phase(t, a, b), 90.0, places=1)
+
+if __name__ == "__main__":
+    unittest.main()
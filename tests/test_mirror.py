@@ -0,0 +1,53 @@
+import unittest
+from fakeport import FakePort, block
+from agilent import FunctionGenerator, Scope
+
+class StateMirrorTest(unittest.TestCase):
+    def setUp(self):
+        self.scope = Scope(port="fake", connect=False)
+        self.port = self.scope.port = FakePort({r":SYST:SET\?" : lambda port, line, match: block("setup")})
+        self.scope.enable_mirror(snapshot=False)
+
+    def test_reads_setting_from_mirror(self):
+        self.scope.command(":TIM:SCAL +1.0E-03")
+        self.port.log = []
+        self.assertEqual(self.scope.query(":TIM:SCAL?"), "+1.0E-03")
+        self.assertEqual(self.port.log, [])
+
+    def test_setup_query_keeps_mirror(self):
+        self.scope.command(":TIM:SCAL +1.0E-03")
+        self.assertEqual(self.scope.setup, "setup")
+        self.assertEqual(self.scope.mirror.read(":TIM:SCAL?"), "+1.0E-03")
+
+    def test_setup_restore_invalidates_mirror(self):
+        self.scope.command(":TIM:SCAL +1.0E-03")
+        self.scope.setup = "setup"
+        self.assertEqual(self.scope.mirror.read(":TIM:SCAL?"), None)
+
+class DependencyTest(unittest.TestCase):
+    def setUp(self):
+        self.generator = FunctionGenerator(port="fake", connect=False)
+        self.port = self.generator.port = FakePort()
+        self.generator.enable_mirror(snapshot=False)
+        self.generator.command("FREQ 1000")
+        self.generator.command("VOLT 2")
+        self.generator.command("OFFS 0.5")
+
+    def test_load_drops_amplitude_and_offset(self):
+        self.generator.command("OUTP:LOAD 50")
+        mirror = self.generator.mirror
+        self.assertEqual(mirror.read("VOLT?"), None)
+        self.assertEqual(mirror.read("OFFS?"), None)
+        self.assertEqual(mirror.read("FREQ?"), "1000")
+        self.assertEqual(mirror.read("OUTP:LOAD?"), "50")
+
+    def test_shape_drops_dependent_settings(self):
+        self.generator.command("FUNC:SHAP TRI")
+        mirror = self.generator.mirror
+        self.assertEqual([mirror.read(query) for query in ("FREQ?", "VOLT?", "OFFS?")], [None, None, None])
+
+    def test_check_interval_needs_front_panel_events(self):
+        self.assertRaises(ValueError, self.generator.enable_mirror, snapshot=False, check_interval=1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import shutil
+import tempfile
+import unittest
+from fakeport import FakePort, block
+from agilent import Scope, ScreenshotArchive, ScreenshotRecorder
+
+class ScreenshotRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.scope = Scope(port="fake", connect=False)
+        self.scope.port = FakePort({r":DISP:DATA\?" : lambda port, line, match: block("II*\0" + "\x55"*2000)}, delay=0.0005)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_commands_while_recording(self):
+        recorder = ScreenshotRecorder(self.scope, ScreenshotArchive(self.path), interval=0)
+        recorder.start()
+        try:
+            for i in range(20):
+                self.scope.command(":TIM:SCAL %d" % i)
+                self.assertEqual(self.scope.query(":TIM:SCAL?"), str(i))
+        finally:
+            recorder.stop()
+        self.assertEqual(recorder.errors, [])
+        self.assertTrue(recorder.captured > 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+import unittest
+import numpy
+from agilent import synth, Capture, CaptureArchive, TransactionIndex
+from agilent.processing import BusWord, DecodePipeline
+
+def capture(transactions, text, timestamp):
+    t, sda, scl = synth.i2c(transactions, sample_rate=4e6, clock=100e3, samples=12000)
+    t, rx = synth.uart(text, baud=115200, sample_rate=4e6, samples=12000, gap=5e-4)
+    return Capture(numpy.array(t), {'SDA' : numpy.array(sda), 'SCL' : numpy.array(scl), 'RX' : numpy.array(rx)}, timestamp)
+
+class TransactionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.archive = CaptureArchive(self.path)
+        self.index = TransactionIndex(self.archive)
+        pipeline = DecodePipeline()
+        pipeline.add('eeprom', 'i2c', sda='SDA', scl='SCL')
+        pipeline.add('console', 'uart', rx='RX', baud=115200)
+        self.captures = [capture([(0x50, synth.WRITE, [0x12, 0x34]), (0x50, synth.READ, [0xab])], "ok", 100.0),
+                         capture([(0x68, synth.WRITE, [0x12]), (0x50, synth.WRITE, [0x56, 0x78])], "hi", 200.0)]
+        self.counts = [self.index.add(c, pipeline.run(*c)) for c in self.captures]
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.path)
+
+    def test_add(self):
+        self.assertEqual(self.counts, [4, 4])
+        self.assertEqual(len(self.index), 8)
+        self.assertEqual(self.archive.timestamps(), [100.0, 200.0])
+
+    def test_search_by_address_and_direction(self):
+        hits = self.index.search('i2c', address=0x50, direction='write')
+        self.assertEqual([(hit.capture_timestamp, hit.payload) for hit in hits], [(100.0, [0x12, 0x34]), (200.0, [0x56, 0x78])])
+        hits = self.index.search('I2C', direction='READ')
+        self.assertEqual([(hit.address, hit.payload) for hit in hits], [(0x50, [0xab])])
+
+    def test_search_by_prefix(self):
+        self.assertEqual([hit.address for hit in self.index.search('i2c', prefix=[0x12])], [0x50, 0x68])
+        self.assertEqual([hit.address for hit in self.index.search('i2c', prefix="1234")], [0x50])
+
+    def test_search_by_decoder_and_time(self):
+        hits = self.index.search(decoder='console', start=150.0)
+        self.assertEqual([chr(hit.payload[0]) for hit in hits], ["h", "i"])
+        self.assertEqual(len(self.index.search(end=150.0)), 4)
+        self.assertEqual(len(self.index.search(decoder='console', limit=3)), 3)
+        self.assertTrue(all(100.0 <= hit.time < 101.0 for hit in self.index.search(end=150.0)))
+
+    def test_hit_capture(self):
+        [hit] = self.index.search('i2c', address=0x68)
+        loaded = hit.capture()
+        self.assertEqual(loaded.timestamp, 200.0)
+        self.assertTrue(numpy.all(loaded['SDA'] == self.captures[1]['SDA']))
+
+    def test_remove(self):
+        self.index.remove(100.0)
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(set(hit.capture_timestamp for hit in self.index.search()), set([200.0]))
+
+    def test_bus_words(self):
+        bus = Capture(numpy.arange(2), {}, 300.0)
+        self.index.add(bus, [(0.0, 'bus', BusWord(0x1234, 0.0)), (1.0, 'bus', BusWord(0xbeef, 1.0))], save=False)
+        self.assertEqual([hit.payload for hit in self.index.search('bus', prefix=[0xbeef])], [[0xbeef]])
+        self.assertEqual(self.archive.timestamps(), [100.0, 200.0])
+
+    def test_reopen(self):
+        self.index.close()
+        self.index = TransactionIndex(self.archive)
+        self.assertEqual(len(self.index), 8)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import time
+import unittest
+from fakeport import FakePort
+from agilent import PowerSupply, SupplyLogger
+from agilent.agilent_e3634a import ramp_profile
+
+def measure(port, line, match):
+    return "%s;+1.0E-01\n" % port.state.get("VOLT", "+0")
+
+class SupplyLoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.supply = PowerSupply(port="fake", connect=False)
+        self.port = self.supply.port = FakePort({r"MEAS:VOLT\?;:MEAS:CURR\?" : measure}, delay=0.0005)
+
+    def test_profile_while_logging(self):
+        logger = SupplyLogger(self.supply, interval=0.005)
+        logger.start()
+        try:
+            time.sleep(0.02)
+            self.supply.run_profile(ramp_profile(5.0, 3.0, steps=4, dwell=0.05))
+            time.sleep(0.02)
+        finally:
+            logger.stop()
+        self.assertEqual(logger.error, None)
+        sent = [line for line in self.port.log if line.startswith("VOLT ")]
+        self.assertEqual(len(sent), 5)
+        voltages = set(voltage for t, voltage, current in logger.samples)
+        # The logger saw every step of the profile
+        self.assertTrue(set([5.0, 4.5, 4.0, 3.5, 3.0]) <= voltages, voltages)
+
+    def test_queries_while_logging(self):
+        logger = SupplyLogger(self.supply, interval=0.001)
+        logger.start()
+        try:
+            for i in range(10):
+                self.supply.voltage = i
+                self.assertEqual(self.supply.voltage, i)
+        finally:
+            logger.stop()
+        self.assertEqual(logger.error, None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from fakeport import FakePort
+from agilent import Scope, FunctionGenerator, Sweep
+
+def error_at(frequency):
+    def apply(port, line, match):
+        if float(match.group(1)) == frequency:
+            port.errors.append('-222,"Data out of range"')
+    return apply
+
+class SweepTest(unittest.TestCase):
+    def setUp(self):
+        self.scope = Scope(port="fake", connect=False)
+        self.scope.port = FakePort({r":OPER:COND\?" : lambda port, line, match: "+0\n",
+                                    r":MEAS:(\w+)\? (\w+)" : lambda port, line, match: "+1.5E+03\n"})
+        self.generator = FunctionGenerator(port="fake", connect=False)
+        self.generator.port = FakePort()
+
+    def test_mnemonics(self):
+        sweep = Sweep(self.generator, self.scope, measurements=("FREQ", "amplitude"))
+        columns = sweep.run([1e3, 2e3])
+        self.assertEqual(columns['CHAN1.FREQ'], [1.5e3, 1.5e3])
+        self.assertEqual(columns['CHAN1.amplitude'], [1.5e3, 1.5e3])
+
+    def test_invalid_measurement(self):
+        self.assertRaises(ValueError, Sweep, self.generator, self.scope, measurements=("bogus",))
+
+    def test_error_at_first_point_is_reported(self):
+        self.generator.port.handlers[r"APPL:SIN ([^,]+),"] = error_at(1e3)
+        sweep = Sweep(self.generator, self.scope)
+        try:
+            sweep.run([1e3, 2e3, 3e3])
+        except Exception, e:
+            self.assertTrue("Data out of range" in str(e))
+        else:
+            self.fail("Error at the first point of the sweep wasn't reported")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import numpy
+from agilent import synth
+from agilent.processing import UARTAnalyzer, UARTStream
+
+class UARTAnalyzerTest(unittest.TestCase):
+    def test_baud_and_parity(self):
+        for baud in (9600, 115200):
+            for parity in (None, 'even', 'odd', 'mark', 'space'):
+                t, rx = synth.uart("Hello", baud=baud, parity=parity, gap=3.0/baud)
+                analyzer = UARTAnalyzer(t, rx, parity=parity)
+                self.assertEqual(analyzer.baud, baud)
+                self.assertEqual(analyzer.data(), "Hello")
+                self.assertEqual([frame.parity_error for frame in analyzer.frames()], [False]*5)
+
+    def test_parity_error(self):
+        t, rx = synth.uart("Hi", parity='even')
+        frames = UARTAnalyzer(t, rx, baud=9600, parity='odd').frames()
+        self.assertEqual([frame.parity_error for frame in frames], [True, True])
+
+    def test_framing_error(self):
+        t, rx = synth.uart("U", baud=9600)
+        rx = numpy.array(rx)
+        # 16 samples per bit, after two bit times of idle: pull the stop bit low
+        rx[(2+9)*16:(2+10)*16] = 0.0
+        frames = UARTAnalyzer(t, rx, baud=9600).frames()
+        self.assertEqual([(frame.value, frame.framing_error) for frame in frames], [(0x55, True)])
+
+    def test_inverted(self):
+        t, rx = synth.uart("Hi", inverted=True)
+        self.assertEqual(UARTAnalyzer(t, rx, inverted=True).data(), "Hi")
+
+    def test_idle_line(self):
+        t, rx = synth.uart("", baud=9600)
+        self.assertEqual(UARTAnalyzer(t, rx, baud=9600).frames(), [])
+
+class UARTStreamTest(unittest.TestCase):
+    def feed(self, stream, t, rx, chunk):
+        frames = []
+        for i in range(0, len(t), chunk):
+            frames += stream.feed(t[i:i+chunk], rx[i:i+chunk])
+        return "".join(chr(frame.value) for frame in frames)
+
+    def test_frames_split_across_chunks(self):
+        t, rx = synth.uart("Hello, world", baud=9600, gap=1e-4)
+        self.assertEqual(self.feed(UARTStream(baud=9600), t, rx, 37), "Hello, world")
+
+    def test_detects_baud_from_first_chunk(self):
+        t, rx = synth.uart("Hello, world", baud=9600, gap=1e-4)
+        stream = UARTStream()
+        self.assertEqual(self.feed(stream, t, rx, 500), "Hello, world")
+        self.assertEqual(stream.baud, 9600)
+
+    def test_idle_before_data(self):
+        t, rx = synth.uart("ok", baud=9600, gap=1e-4)
+        stream = UARTStream(baud=9600)
+        idle = numpy.arange(-50, 0)/(16*9600.0)
+        self.assertEqual(stream.feed(idle, [3.3]*50), [])
+        self.assertEqual(self.feed(stream, t, rx, 64), "ok")
+
+if __name__ == "__main__":
+    unittest.main()